@@ -8,11 +8,20 @@ import ecg_utils.nk_pipeline as nk_pipeline
 import ecg_utils.data_utils as data_utils
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import datetime
+import re
 import traceback
 from typing import Dict, Union, Optional, List, Tuple
 #fmt:on
 
+# float columns with names matching this pattern (e.g., 'start_time', 'time_seconds_original_file', 'stop_index') hold 
+# times or positions and are not downcasted to float32, which would round them (e.g., 29.998 to 29.997999)
+_FULL_PRECISION_COLUMNS = re.compile(r"(^|_)(time|index)(_|$)", re.IGNORECASE)
+
     
 def compute_windowed_hrv_across_segments(
     segments_df_list: List[pd.DataFrame], 
@@ -20,8 +29,10 @@ def compute_windowed_hrv_across_segments(
     figure_output_dir: Union[str, Path], 
     data_output_dir: Union[str, Path], 
     subject_id: Union[str, int],
-    create_qa_plots:bool=True
-) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    create_qa_plots:bool=True,
+    n_jobs: int = 1,
+    return_preprocessed_data: bool = True
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
     """
     Compute windowed Heart Rate Variability (HRV) metrics across multiple ECG data segments.
 
@@ -34,18 +45,24 @@ def compute_windowed_hrv_across_segments(
         segments_df_list (List[pd.DataFrame]): A list of DataFrames, where each DataFrame represents
             a segment of ECG data. Each segment must contain an `event_name` column identifying the segment.
         parameters (Dict): A dictionary containing configuration parameters for HRV calculations, such as 
-            window length and sampling frequency.
+            window length and sampling frequency. If `parameters['io']['excel']` is True, the HRV metrics 
+            are additionally exported as an Excel file.
         figure_output_dir (Union[str, Path]): Directory to save QA plots, if `create_qa_plots` is True.
         data_output_dir (Union[str, Path]): Directory to save the output HRV metrics and preprocessed ECG data.
         subject_id (Union[str, int]): Unique identifier for the subject to which the segments belong.
         create_qa_plots (bool, optional): If True, generates and saves QA plots for each segment. Defaults to True.
+        n_jobs (int, optional): Number of worker processes used to compute the HRV metrics of the segments in 
+            parallel (segments are independent of each other). -1 uses all CPU cores. Defaults to 1 (sequential).
+        return_preprocessed_data (bool, optional): If True, the (downcasted) preprocessed ECG data of all segments is 
+            returned, i.e., the same DataFrame that is written to `preprocessed_ecg.parquet`. If False, None is returned 
+            instead and the DataFrame is released after export. Defaults to True.
 
     Returns:
-        Tuple[pd.DataFrame, pd.DataFrame]: 
+        Tuple[pd.DataFrame, Optional[pd.DataFrame]]: 
             - A DataFrame containing concatenated HRV metrics for all segments, with `segment_name` 
               and `subject_id` columns added.
             - A DataFrame containing concatenated preprocessed ECG data for all segments, with `segment_name` 
-              and `subject_id` columns added.
+              and `subject_id` columns added (None if `return_preprocessed_data` is False).
 
     Raises:
         ValueError: If the input `segments_df_list` does not contain valid segments or required columns.
@@ -67,43 +84,194 @@ def compute_windowed_hrv_across_segments(
     Notes:
         - The function assumes that the `nk_pipeline.calculate_windowed_HRV_metrics` is available 
           for calculating HRV metrics.
-        - HRV metrics are saved in an Excel file named `hrv_metrics.xlsx`.
-        - Preprocessed ECG data is saved in a CSV file named `preprocessed_ecg.csv`.
+        - HRV metrics are saved in a Parquet file named `hrv_metrics.parquet` (and optionally in `hrv_metrics.xlsx`).
+        - Preprocessed ECG data is saved in a Parquet file named `preprocessed_ecg.parquet`, with the same 
+          (downcasted) dtypes as the returned DataFrame. Each segment is written as a separate row group.
 
     """
     figure_output_dir = Path(figure_output_dir)
     data_output_dir = Path(data_output_dir)
     
+    preprocessed_data_file = data_output_dir / "preprocessed_ecg.parquet"
     all_hrv_metrics = []
     all_preprocessed_data = []
+    segment_names = []
 
-    for segment_df in segments_df_list:
-        segment_name = segment_df["event_name"].iloc[0]
-        hrv_segment_metrics_df = nk_pipeline.calculate_windowed_HRV_metrics(
-            segment_df, 
-            parameters, 
-            export_segment_plot=create_qa_plots,
-            figure_output_dir=figure_output_dir, 
-            segment_name=segment_name
-        )
+    # QA plots are saved by background threads while the next windows are processed
+    with ThreadPoolExecutor(max_workers=2) as plot_executor:
+        # Calculate the HRV metrics per segment (lazily), either sequentially or distributed across worker processes
+        if n_jobs == 1:
+            segment_results = (
+                _process_segment(segment_df, parameters, figure_output_dir, create_qa_plots, plot_executor) 
+                for segment_df in segments_df_list
+            )
+        else:
+            # the parameters are resolved into an EcgConfig once, instead of in every worker process
+            ecg_config = params.as_ecg_config(parameters)
+            segment_results = Parallel(n_jobs=n_jobs, backend='loky', return_as='generator')(
+                delayed(_process_segment)(segment_df, ecg_config, figure_output_dir, create_qa_plots) 
+                for segment_df in segments_df_list
+            )
         
-        # Add HRV metrics and preprocessed data to lists
-        hrv_segment_metrics_df = hrv_segment_metrics_df.assign(segment_name = segment_name)
-        all_hrv_metrics.append(hrv_segment_metrics_df)
-        segment_df = segment_df.assign(segment_name = segment_name)
-        all_preprocessed_data.append(segment_df)
+        for segment_df, (segment_name, hrv_segment_metrics_df) in zip(segments_df_list, segment_results):
+            segment_names.append(segment_name)
+            all_hrv_metrics.append(hrv_segment_metrics_df)
+            all_preprocessed_data.append(_optimize_dtypes(segment_df))
 
-    # Concatenate all HRV metrics and preprocessed data
+    # Concatenate all HRV metrics. Segment names and the subject id are added once after concatenation
     concatenated_hrv_metrics = pd.concat(all_hrv_metrics, ignore_index=True)
-    concatenated_hrv_metrics = concatenated_hrv_metrics.assign(subject_id = subject_id)
-    concatenated_preprocessed_data = pd.concat(all_preprocessed_data, ignore_index=True)
-    concatenated_preprocessed_data = concatenated_preprocessed_data.assign(subject_id = subject_id)
+    concatenated_hrv_metrics["segment_name"] = _repeat_segment_names(segment_names, all_hrv_metrics)
+    concatenated_hrv_metrics["subject_id"] = subject_id
+    concatenated_hrv_metrics = _optimize_dtypes(concatenated_hrv_metrics)
+    
+    # save the HRV metrics (parquet is the default format, excel is only written on request)
+    concatenated_hrv_metrics.to_parquet(data_output_dir / "hrv_metrics.parquet", engine="pyarrow", compression="zstd")
+    if parameters.get('io', {}).get('excel', False):
+        concatenated_hrv_metrics.to_excel(data_output_dir / "hrv_metrics.xlsx")
+
+    # Concatenate the preprocessed data. Segment names and the subject id are added once after concatenation 
+    # to avoid copying every segment
+    segment_lengths = [len(segment_df) for segment_df in all_preprocessed_data]
+    concatenated_preprocessed_data = _concat_segments(all_preprocessed_data)
+    concatenated_preprocessed_data["segment_name"] = _repeat_segment_names(segment_names, all_preprocessed_data)
+    concatenated_preprocessed_data["subject_id"] = subject_id
+    concatenated_preprocessed_data = _optimize_dtypes(concatenated_preprocessed_data)
+    del all_preprocessed_data
     
-    # save the data
-    concatenated_hrv_metrics.to_excel(data_output_dir / "hrv_metrics.xlsx")
-    concatenated_preprocessed_data.to_csv(data_output_dir / "preprocessed_ecg.csv")
+    # save the preprocessed data from the same (downcasted) DataFrame that is returned, one row group per segment
+    preprocessed_data_table = pa.Table.from_pandas(concatenated_preprocessed_data, preserve_index=False)
+    with pq.ParquetWriter(preprocessed_data_file, preprocessed_data_table.schema, compression="zstd") as preprocessed_data_writer:
+        for start, length in zip(np.cumsum([0] + segment_lengths[:-1]), segment_lengths):
+            preprocessed_data_writer.write_table(preprocessed_data_table.slice(start, length))
 
+    if not return_preprocessed_data:
+        return concatenated_hrv_metrics, None
     return concatenated_hrv_metrics, concatenated_preprocessed_data
+
+
+
+##########################
+#### HELPER FUNCTIONS ####
+##########################
+
+def _process_segment(
+    segment_df: pd.DataFrame, 
+    parameters: Union[Dict, params.EcgConfig], 
+    figure_output_dir: Path, 
+    create_qa_plots: bool,
+    plot_executor: Optional[Executor] = None
+) -> Tuple[str, pd.DataFrame]:
+    """
+    Calculates the windowed HRV metrics of a single segment. Used as unit of work by 
+    `compute_windowed_hrv_across_segments`, so it must remain picklable (i.e., a module-level function).
+
+    Args:
+        segment_df (pd.DataFrame): The segment of ECG data, containing an `event_name` column.
+        parameters (Union[Dict, EcgConfig]): The configuration parameters for HRV calculations.
+        figure_output_dir (Path): Directory to save QA plots, if `create_qa_plots` is True.
+        create_qa_plots (bool): If True, generates and saves QA plots for the segment.
+        plot_executor (Optional[Executor], optional): Executor used to save the QA plots in the background. 
+            Cannot be used from worker processes. Defaults to None (a dedicated executor is used for the segment).
+
+    Returns:
+        Tuple[str, pd.DataFrame]: The segment name and the (downcasted) HRV metrics of the segment.
+    """
+    segment_name = segment_df["event_name"].iloc[0]
+    hrv_segment_metrics_df = nk_pipeline.calculate_windowed_HRV_metrics(
+        segment_df, 
+        parameters, 
+        export_segment_plot=create_qa_plots,
+        figure_output_dir=figure_output_dir, 
+        segment_name=segment_name,
+        plot_executor=plot_executor
+    )
+    return segment_name, _optimize_dtypes(hrv_segment_metrics_df)
+
+
+def _concat_segments(segment_dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates segment DataFrames (with identical columns) row-wise, equivalent to `pd.concat(segment_dfs, ignore_index=True)`.
+    Numeric columns are written into a single preallocated array per column, which avoids the intermediate 
+    copies made by `pd.concat`. Columns with non-numeric or differing dtypes are concatenated with pandas.
+
+    Args:
+        segment_dfs (List[pd.DataFrame]): The DataFrames to concatenate.
+
+    Returns:
+        pd.DataFrame: The concatenated DataFrame with a new RangeIndex.
+    """
+    columns = segment_dfs[0].columns
+    if not all(segment_df.columns.equals(columns) for segment_df in segment_dfs):
+        return pd.concat(segment_dfs, ignore_index=True)
+    
+    segment_offsets = np.cumsum([0] + [len(segment_df) for segment_df in segment_dfs])
+    concatenated_columns = {}
+    for col in columns:
+        dtypes = {segment_df[col].dtype for segment_df in segment_dfs}
+        dtype = dtypes.pop()
+        if not dtypes and isinstance(dtype, np.dtype) and pd.api.types.is_numeric_dtype(dtype):
+            values = np.empty(segment_offsets[-1], dtype=dtype)
+            for segment_df, start, stop in zip(segment_dfs, segment_offsets[:-1], segment_offsets[1:]):
+                values[start:stop] = segment_df[col].to_numpy()
+            concatenated_columns[col] = values
+        else:
+            concatenated_columns[col] = pd.concat([segment_df[col] for segment_df in segment_dfs], ignore_index=True)
+    
+    return pd.DataFrame(concatenated_columns, columns=columns, copy=False)
+
+
+def _repeat_segment_names(segment_names: List[str], segment_dfs: List[pd.DataFrame]) -> pd.Categorical:
+    """
+    Creates a categorical segment name column for the concatenation of the given segment DataFrames.
+
+    Args:
+        segment_names (List[str]): The name of each segment.
+        segment_dfs (List[pd.DataFrame]): The DataFrames of each segment, in the same order as `segment_names`.
+
+    Returns:
+        pd.Categorical: The segment name of each row of the concatenated DataFrames.
+    """
+    segment_lengths = [len(segment_df) for segment_df in segment_dfs]
+    return pd.Categorical(np.repeat(segment_names, segment_lengths))
+
+
+def _optimize_dtypes(df: pd.DataFrame, max_category_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    Downcasts the columns of a DataFrame to reduce its memory footprint before concatenation and export.
+
+    - float64 columns are cast to float32 if their values fit into the float32 range. Time and index columns 
+      (see `_FULL_PRECISION_COLUMNS`) are kept as float64.
+    - int64 columns are cast to int32 if their values fit into the int32 range.
+    - object columns with few unique values (e.g., `segment_name`, `subject_id`) are converted to categoricals.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to downcast.
+        max_category_ratio (float, optional): Maximum ratio of unique values to rows for an object column
+            to be converted to a categorical. Defaults to 0.5.
+
+    Returns:
+        pd.DataFrame: A DataFrame with downcasted column dtypes. The index is left untouched.
+    """
+    float32_info = np.finfo(np.float32)
+    int32_info = np.iinfo(np.int32)
+    
+    dtypes = {}
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == np.float64:
+            if _FULL_PRECISION_COLUMNS.search(str(col)):
+                continue
+            values = series.to_numpy()
+            if np.isnan(values).all() or (np.nanmin(values) >= float32_info.min and np.nanmax(values) <= float32_info.max):
+                dtypes[col] = np.float32
+        elif series.dtype == np.int64:
+            if len(series) == 0 or (series.min() >= int32_info.min and series.max() <= int32_info.max):
+                dtypes[col] = np.int32
+        elif series.dtype == object or col == 'segment_name':
+            if len(series) > 0 and series.nunique(dropna=True) / len(series) <= max_category_ratio:
+                dtypes[col] = 'category'
+    
+    return df.astype(dtypes) if dtypes else df
         
 
 
@@ -2,6 +2,10 @@ import pandas as pd
 from pathlib import Path
 import numpy as np
 from typing import Union, List
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, the NumPy implementation is used instead
+    njit = None
 
 
 
@@ -25,12 +29,8 @@ def flag_windows_insufficient_n_peaks(metrics_df: pd.DataFrame, min_peaks_requir
             - True: The window has sufficient peaks (>= min_peaks_required).
             - False: The window has insufficient peaks (< min_peaks_required).
     """
-    condition = metrics_df.n_peaks_detected < min_peaks_required
-    metrics_df["window_has_enough_peaks"] = np.where(
-        condition,
-        False,
-        True
-    )
+    n_peaks_detected = metrics_df["n_peaks_detected"].to_numpy(copy=False)
+    metrics_df["window_has_enough_peaks"] = n_peaks_detected >= min_peaks_required
     return metrics_df
 
 
@@ -53,27 +53,83 @@ def flag_outliers_based_on_zscore(
         pd.DataFrame: The original DataFrame with a new column indicating outliers.
                       The new column name is the input column name plus '_outlier'.
     """
+    return flag_outliers_based_on_zscore_batch(df, [column], z_threshold)
+
+
+def flag_outliers_based_on_zscore_batch(
+    df: pd.DataFrame, 
+    columns: List[str], 
+    z_threshold: float
+) -> pd.DataFrame:
+    """
+    Flags outliers in multiple columns at once based on a z-score approach, considering only rows 
+    where 'window_has_enough_peaks' is True. The z-scores of all columns are computed in a single 
+    vectorized pass over the (valid rows x columns) matrix.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame.
+        columns (List[str]): The names of the columns for outlier detection.
+        z_threshold (float): The z-score threshold above which a value is flagged as an outlier.
+
+    Returns:
+        pd.DataFrame: The original DataFrame with a new column per input column indicating outliers.
+                      The new column names are the input column names plus '_outlier'.
+    """
     # Ensure 'window_has_enough_peaks' exists in the DataFrame
     if "window_has_enough_peaks" not in df.columns:
         raise ValueError("The DataFrame must contain a 'window_has_enough_peaks' column.")
     
-    # Compute the z-score only for rows where 'window_has_enough_peaks' is True
-    valid_rows = df["window_has_enough_peaks"] == True
-    values = df.loc[valid_rows, column]
-    z_scores = (values - values.mean()) / values.std(ddof=0)
-    
-    # Create the new column name
-    outlier_column_name = f"{column}_outlier"
+    # Compute the z-scores only for rows where 'window_has_enough_peaks' is True
+    valid_rows = df["window_has_enough_peaks"].to_numpy(copy=False) == True
+    values = df[columns].to_numpy(dtype=np.float64)[valid_rows]
     
-    # Initialize the new column with NaN (explicitly setting dtype to float)
-    df[outlier_column_name] = np.nan
+    if njit is not None:
+        is_outlier = np.empty(values.shape, dtype=np.float32)
+        _zscore_outlier_flags(values, float(z_threshold), is_outlier)
+    else:
+        # |x - mean| > threshold * std is equivalent to |z| > threshold but avoids the division.
+        # NaN values are ignored for mean and std (like pandas does) and are not flagged as outliers.
+        is_outlier = np.abs(values - np.nanmean(values, axis=0)) > z_threshold * np.nanstd(values, axis=0)
     
-    # Flag outliers as True/False and cast to float to align with NaN dtype
-    df.loc[valid_rows, outlier_column_name] = (np.abs(z_scores) > z_threshold).astype(float)
+    # Rows that are not valid remain NaN, the others are flagged with 1.0 (outlier) or 0.0
+    outlier_flags = np.full((len(df), len(columns)), np.nan, dtype=np.float32)
+    outlier_flags[valid_rows] = is_outlier
+    df[[f"{column}_outlier" for column in columns]] = outlier_flags
     
     return df
 
 
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _zscore_outlier_flags(values: np.ndarray, z_threshold: float, outlier_flags: np.ndarray) -> None:
+        """
+        Numba kernel of `flag_outliers_based_on_zscore_batch`. For each column (in parallel), the mean and 
+        the (population) standard deviation are computed in a single pass with Welford's algorithm, then 
+        values with |x - mean| > z_threshold * std are flagged with 1.0 in `outlier_flags` (0.0 otherwise).
+        NaN values are ignored for mean and std and are not flagged, same as in the NumPy implementation.
+        Note that fastmath must not be enabled, as it breaks the NaN handling.
+        """
+        n_rows, n_cols = values.shape
+        for col in prange(n_cols):
+            count = 0
+            mean = 0.0
+            sum_squared_deviations = 0.0
+            for row in range(n_rows):
+                x = values[row, col]
+                if not np.isnan(x):
+                    count += 1
+                    delta = x - mean
+                    mean += delta / count
+                    sum_squared_deviations += delta * (x - mean)
+            if count == 0:
+                mean = np.nan
+                std = np.nan
+            else:
+                std = np.sqrt(sum_squared_deviations / count)
+            for row in range(n_rows):
+                outlier_flags[row, col] = 1.0 if np.abs(values[row, col] - mean) > z_threshold * std else 0.0
+
+
 def flag_usable_aggregation_windows(df: pd.DataFrame) -> pd.DataFrame:
     """
     Adds a column to the DataFrame indicating whether or not an analysis window can be used for aggregation of HRV and RSA values. 
@@ -94,11 +150,14 @@ def flag_usable_aggregation_windows(df: pd.DataFrame) -> pd.DataFrame:
     """
     # Ensure necessary columns exist
     required_columns = ["window_has_enough_peaks", "HRV_SDNN_outlier"]
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"The DataFrame must contain the column '{col}'.")
+    missing_columns = set(required_columns).difference(df.columns)
+    if missing_columns:
+        raise ValueError(f"The DataFrame must contain the columns {sorted(missing_columns)}.")
 
     # Add the new column
-    df["usable_window"] = (df["window_has_enough_peaks"] == True) & (df["HRV_SDNN_outlier"] == 0.0)
+    # missing values (NaN/None/NA) in either column compare unequal and the window is therefore not usable
+    has_enough_peaks = df["window_has_enough_peaks"].eq(True).fillna(False).to_numpy(dtype=bool)
+    is_not_outlier = df["HRV_SDNN_outlier"].eq(0.0).fillna(False).to_numpy(dtype=bool)
+    df["usable_window"] = has_enough_peaks & is_not_outlier
 
     return df
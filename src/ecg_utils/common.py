@@ -5,14 +5,34 @@ Common functions
 
 # fmt: off
 from typing import Dict, Tuple, Union, List, Optional, Any
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import yaml
 import os
 import logging
+import functools
+from copy import deepcopy
+try:
+    # libyaml-based loader and dumper (considerably faster than the pure-Python implementation)
+    from yaml import CSafeLoader as YamlSafeLoader, CSafeDumper as YamlSafeDumper
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader, SafeDumper as YamlSafeDumper
 # fmt: on
 
 
+class _YamlParamsDumper(YamlSafeDumper):
+    """
+    Safe YAML dumper (only standard YAML tags, which the safe loader can read) that additionally writes tuples 
+    (e.g., the HRV frequency bands) as plain sequences, dictionary subclasses (e.g., the read-only `base_params`) 
+    as plain mappings and NumPy scalars as the corresponding Python values.
+    """
+
+_YamlParamsDumper.add_representer(tuple, _YamlParamsDumper.represent_list)
+_YamlParamsDumper.add_multi_representer(dict, _YamlParamsDumper.represent_dict)
+_YamlParamsDumper.add_multi_representer(np.generic, lambda dumper, value: dumper.represent_data(value.item()))
+
+
 ##########################
 #### COMMON FUNCTIONS ####
 ##########################
@@ -39,6 +59,32 @@ def comma_str_2_float(x):
     else:
         raise ValueError(f"Expected either string or number, got {type(x)} for {x}")
 
+def comma_str_series_to_float(series: pd.Series, errors: str = "raise") -> pd.Series:
+    """
+    Vectorized version of `comma_str_2_float` for an entire Series. Strings with commas as 
+    decimal separators are converted to floats, numbers (and missing values) are kept as they are.
+
+    Parameters:
+    series (pd.Series): The Series to be converted. May contain a mix of strings and numbers.
+    errors (str): How to handle values that cannot be converted, passed on to `pd.to_numeric`. 
+        'raise' (default) raises a ValueError, 'coerce' sets them to NaN.
+
+    Returns:
+    pd.Series: The converted numeric Series.
+
+    Raises:
+    ValueError: If a value cannot be converted and errors='raise'.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    # object Series without any strings (e.g., only ints and floats) do not support the .str accessor
+    if pd.api.types.infer_dtype(series, skipna=True) not in ("string", "mixed", "mixed-integer"):
+        return pd.to_numeric(series, errors=errors)
+    # .str methods return NaN for non-string values, for which the original values are kept
+    replaced_series = series.str.replace(",", ".", regex=False)
+    replaced_series = replaced_series.where(replaced_series.notna(), series)
+    return pd.to_numeric(replaced_series, errors=errors)
+
 def export_to_yaml(data: Dict[str, Any], output_path: Union[str, Path]) -> None:
     """
     Exports a dictionary to a YAML file at the specified output path.
@@ -51,28 +97,37 @@ def export_to_yaml(data: Dict[str, Any], output_path: Union[str, Path]) -> None:
     Returns:
         None
     """
-    # Convert output path to Path object if it is a string
-    output_path = Path(output_path)
-    
-    with output_path.open('w') as file:
-        yaml.dump(data, file, default_flow_style=False)
+    # open() accepts both strings and Path objects, no need to wrap the path
+    with open(output_path, 'w') as file:
+        yaml.dump(data, file, Dumper=_YamlParamsDumper, default_flow_style=False)
         
 def load_from_yaml(input_path: Union[str, Path]) -> Dict[str, Any]:
     """
     Loads parameters from a YAML file into a Python dictionary.
+    Parsed files are cached per path and modification time, so repeatedly loading an unchanged 
+    file (e.g., once per subject) only parses it once.
 
     Args:
         input_path (Union[str, Path]): The path to the YAML file to be loaded.
             Can be a string or a Path object.
 
     Returns:
-        Dict[str, Any]: The dictionary containing the loaded parameters.
+        Dict[str, Any]: The dictionary containing the loaded parameters. A copy of the cached 
+            data is returned, so it can safely be modified by the caller.
     """
-    # Convert input path to Path object if it is a string
-    input_path = Path(input_path)
+    input_path = os.path.abspath(input_path)
+    data = _load_from_yaml_cached(input_path, os.stat(input_path).st_mtime_ns)
     
-    with input_path.open('r') as file:
-        data = yaml.safe_load(file)
+    return deepcopy(data)
+
+@functools.lru_cache(maxsize=32)
+def _load_from_yaml_cached(input_path: str, mtime_ns: int) -> Dict[str, Any]:
+    """
+    Parses a YAML file. The modification time is only part of the cache key of `load_from_yaml`, 
+    so that changes to the file invalidate the cached data.
+    """
+    with open(input_path, 'r') as file:
+        data = yaml.load(file, Loader=YamlSafeLoader)
     
     return data
 
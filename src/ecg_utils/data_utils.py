@@ -6,6 +6,7 @@ Data loading functions
 # fmt: off
 from typing import Dict, Tuple, Union, List, Optional, Any
 import warnings
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import ecg_utils.common as common
@@ -38,7 +39,8 @@ def preprocess_event_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Preprocesses the event data by performing the following steps:
     1. Removes the first row of the DataFrame and resets the index.
-    2. Adds event start and stop markers to the DataFrame.
+    2. Converts the 'Name' column to a categorical (few unique event names, faster comparisons).
+    3. Adds event start and stop markers to the DataFrame.
 
     Args:
         df (pd.DataFrame): The input DataFrame containing event data.
@@ -49,6 +51,7 @@ def preprocess_event_data(df: pd.DataFrame) -> pd.DataFrame:
     if not isinstance(df, pd.DataFrame):
         raise TypeError("Input must be a pandas DataFrame.")
     df = df.iloc[1:].reset_index(drop=True)
+    df['Name'] = df['Name'].astype('category')
     df = add_event_start_stop_marker(df)
     return df
 
@@ -62,12 +65,18 @@ def add_event_start_stop_marker(df: pd.DataFrame) -> pd.DataFrame:
     Parameters:
         df (pd.DataFrame): The input DataFrame containing a 'Name' column.
     Returns:
-        pd.DataFrame: The modified DataFrame with the 'on_offset' column added.
+        pd.DataFrame: The modified DataFrame with the categorical 'on_offset' column added.
     """
     if not isinstance(df, pd.DataFrame):
         raise TypeError("Input must be a pandas DataFrame.")
-    df.loc[~df['Name'].duplicated(), 'on_offset'] = 'onset'
-    df.loc[df['Name'].duplicated(), 'on_offset'] = 'offset'
+    # pd.factorize numbers the names in order of first appearance, so a row is the first occurrence 
+    # of its name (i.e., the onset) if and only if its code is larger than all codes before it
+    codes, _ = pd.factorize(df['Name'], sort=False, use_na_sentinel=False)
+    previous_max_codes = np.maximum.accumulate(np.concatenate(([-1], codes[:-1])))
+    df['on_offset'] = pd.Categorical(
+        np.where(codes > previous_max_codes, 'onset', 'offset'), 
+        categories=['onset', 'offset']
+    )
     
     return df
     
@@ -95,7 +104,8 @@ def segment_df(df: pd.DataFrame, pipeline_params: Dict) -> List[pd.DataFrame]:
     Notes:
         - For "Baseline" segments, if the offset time is not found, it is calculated using 
           the `default_duration_seconds` and the `sampling_frequency`.
-        - Onset and offset times are retrieved using the `get_event_time_from_dataframe_index` function.
+        - Onset and offset times are retrieved from a lookup table built once with `_build_event_index`
+          (equivalent to calling `get_event_time_from_dataframe_index` per segment).
 
     Example:
         pipeline_params = {
@@ -109,7 +119,13 @@ def segment_df(df: pd.DataFrame, pipeline_params: Dict) -> List[pd.DataFrame]:
         }
         segments = segment_df(df, pipeline_params)
     """
+    # positional slicing with np.searchsorted requires a sorted index
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    time_index = df.index.to_numpy()
+    
     segments = []
+    event_bounds = _build_event_index(df)
     for _, segment_info_dict in pipeline_params['segmentation'].items():
         # Extract the information from the dictionary. 
         segment_name = segment_info_dict['event_name']
@@ -119,12 +135,10 @@ def segment_df(df: pd.DataFrame, pipeline_params: Dict) -> List[pd.DataFrame]:
             default_duration_seconds = int(default_duration_seconds)
         
         # get the onset and offset times (i.e., the row_index)
-        event_onset_time = get_event_time_from_dataframe_index(event_name = segment_name, is_onset = True, df = df)
-        event_offset_time = get_event_time_from_dataframe_index(event_name = segment_name, is_onset = False, df = df)
-        
-        if event_onset_time is None and event_offset_time is None:
-            Warning(f"Event {segment_name} not found in the DataFrame.")
+        if segment_name not in event_bounds:
+            warnings.warn(f"Event {segment_name} not found in the DataFrame.")
             continue
+        event_onset_time, event_offset_time = event_bounds[segment_name]
         
         if not event_offset_time and segment_name == 'Baseline':
             # if the offset time is not found, use the default duration to calculate the offset time. But only for baseline
@@ -132,14 +146,42 @@ def segment_df(df: pd.DataFrame, pipeline_params: Dict) -> List[pd.DataFrame]:
         elif event_onset_time and (not event_offset_time) and segment_name != 'Baseline':
             raise ValueError(f"Offset time for segment {segment_name} not found. Please check the event indices.")
 
-        # retrieve the data in between (inclusive bounds) the onset and offset time using the index
-        segment = df[(df.index >= event_onset_time) & (df.index < event_offset_time)]
+        # retrieve the data in between the onset (inclusive) and offset (exclusive) time using the index
+        start = np.searchsorted(time_index, event_onset_time, side='left')
+        stop = np.searchsorted(time_index, event_offset_time, side='left')
+        segment = df.iloc[start:stop]
         if segment.empty:
             raise ValueError(f"Segment {segment_name} is empty between {event_onset_time} and {event_offset_time} ms. Please check the event indices.")
             
         segments.append(segment)
     
     return segments
+
+
+def _build_event_index(df: pd.DataFrame) -> Dict[str, Tuple[Optional[Any], Optional[Any]]]:
+    """
+    Builds a lookup table with the index of the first onset and offset of each event, resolved in a single pass.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame containing the 'event_name' and 'on_offset' columns.
+            Rows without event information (NaN) are ignored.
+
+    Returns:
+        Dict[str, Tuple[Optional[Any], Optional[Any]]]: A dictionary mapping each event name to the DataFrame 
+        index of its (onset, offset). Missing onsets or offsets are None, 
+        e.g. {'Baseline': (1200, None), 'Story 1': (5000, 9000)}.
+    """
+    assert 'event_name' in df.columns 
+    assert 'on_offset' in df.columns
+    
+    events = df[['event_name', 'on_offset']].dropna()
+    first_events = events[~events.duplicated()]
+    
+    is_onset = (first_events['on_offset'] == 'onset').to_numpy()
+    onsets = dict(zip(first_events['event_name'][is_onset], first_events.index[is_onset]))
+    offsets = dict(zip(first_events['event_name'][~is_onset], first_events.index[~is_onset]))
+    
+    return {event_name: (onsets.get(event_name), offsets.get(event_name)) for event_name in {**onsets, **offsets}}
         
     
 def get_event_time_from_dataframe_index(event_name: str, is_onset: bool, 
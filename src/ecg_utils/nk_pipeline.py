@@ -1,29 +1,49 @@
 """
 This module contains functions for processing ECG signals and computing HRV metrics using NeuroKit2. 
 It essentially wraps NeuroKit2 functions
+
+All functions accept the parameters either as dictionary (structured like `parameters.base_params`) or as 
+`parameters.EcgConfig`. Resolve them once with `EcgConfig.from_dict` when calling the functions repeatedly.
 """
 
 # fmt: off
 from typing import Dict, Tuple, Union, List, Optional
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import nullcontext
+import hashlib
+import json
 import neurokit2 as nk
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from joblib import Parallel, delayed
+import ecg_utils.parameters as params
 import ecg_utils.plot_utils as plot_utils
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the NumPy implementation is used instead
+    njit = None
 # fmt: on
 
+# Minimum number of R-peaks of an analysis window for HRV calculation (RMSSD needs at least two successive RR intervals, 
+# SDNN should be based on more). Windows with fewer peaks get NaN HRV metrics without calling NeuroKit2.
+MIN_PEAKS_FOR_HRV = 4
+
+# Columns describing an analysis window, placed after the HRV metrics in the output of `calculate_windowed_HRV_metrics`
+_WINDOW_INFO_COLUMNS = ['start_time', 'end_time', 'analysis_window', 'heart_rate_bpm', 'n_peaks_detected']
+
 
 ####################################################
 ##### ECG PREPROCESSING AND ANALSYSIS FUNCTIONS ####
 ####################################################
 
-def clean_ecg(ecg_raw_series: pd.Series, parameters: Dict, **kwargs) -> pd.Series:
+def clean_ecg(ecg_raw_series: pd.Series, parameters: Union[Dict, params.EcgConfig], **kwargs) -> pd.Series:
     """
     Cleans the ECG signal using NeuroKit2's `ecg_clean` function based on the provided parameters.
 
     Args:
         ecg_raw_series (pd.Series): The raw ECG signal as a pandas Series.
-        parameters (dict): A dictionary containing the cleaning parameters. Expected keys:
+        parameters (Union[Dict, EcgConfig]): A dictionary containing the cleaning parameters. Expected keys:
             - 'sampling_frequency' (int): The sampling frequency of the ECG data.
             - 'cleaning' (dict): A dictionary with the cleaning method and powerline frequency.
                 - 'method' (str): The cleaning method to use (e.g., 'neurokit', 'biosppy', 'elgendi', etc.).
@@ -36,28 +56,31 @@ def clean_ecg(ecg_raw_series: pd.Series, parameters: Dict, **kwargs) -> pd.Serie
     if not isinstance(ecg_raw_series, pd.Series):
         raise ValueError("The 'ecg_raw_series' argument must be a pandas Series.")
     
+    ecg_config = params.as_ecg_config(parameters)
     cleaned_series = pd.Series(
         nk.ecg_clean(
             ecg_raw_series, 
-            sampling_rate=parameters['general'].get('sampling_frequency', 500), 
-            method=parameters['cleaning'].get('method', 'neurokit'),
-            powerline=parameters['cleaning'].get('powerline', 50),  # Optional powerline filtering
+            sampling_rate=ecg_config.sampling_frequency, 
+            method=ecg_config.cleaning_method,
+            powerline=ecg_config.powerline,  # Optional powerline filtering
             **kwargs  # additional method-specific parameters
         )
     )
     cleaned_series.name = 'ECG_Clean'
     return cleaned_series
 
-def find_peaks(ecg_cleaned_series: pd.Series, parameters: Dict, **kwargs) -> Tuple[pd.DataFrame, dict]:
+def find_peaks(ecg_cleaned_series: pd.Series, parameters: Union[Dict, params.EcgConfig], **kwargs) -> Tuple[pd.DataFrame, dict]:
     """
     Detects R-peaks in a cleaned ECG signal using NeuroKit2's `ecg_peaks` function based on the provided parameters.
 
     Args:
         ecg_cleaned_series (pd.Series): The cleaned ECG signal as a pandas Series.
-        parameters (dict): A dictionary containing the peak detection parameters. Expected keys:
+        parameters (Union[Dict, EcgConfig]): A dictionary containing the peak detection parameters. Expected keys:
             - 'sampling_frequency' (int): The sampling frequency of the ECG data.
             - 'peak_detection' (dict): A dictionary with the peak detection method and artifact correction settings.
-                - 'method' (str): The peak detection method to use.
+                - 'method' (str): The peak detection method to use (any method of `nk.ecg_findpeaks`, e.g., 'neurokit' or 
+                  'vg' for the visibility graph detector, which runs in linear time and is suited for long recordings, 
+                  but requires the optional `ts2vg` package).
                 - 'correct_artifacts' (bool): Whether to apply artifact correction during peak detection.
         **kwargs: Additional method-specific parameters for `ecg_peaks`.
 
@@ -70,24 +93,26 @@ def find_peaks(ecg_cleaned_series: pd.Series, parameters: Dict, **kwargs) -> Tup
               - "sampling_rate": The sampling rate of the signal.
               - "method" etc...
     """
+    ecg_config = params.as_ecg_config(parameters)
     signal_df, peaks_dict = nk.ecg_peaks(
         ecg_cleaned=ecg_cleaned_series,
-        sampling_rate=parameters['general'].get('sampling_frequency', 500),
-        method=parameters['peak_detection'].get('method', 'neurokit'),
-        correct_artifacts=parameters['peak_detection'].get('correct_artifacts', False),
+        sampling_rate=ecg_config.sampling_frequency,
+        method=ecg_config.peak_method,
+        correct_artifacts=ecg_config.correct_artifacts,
         **kwargs
     )
     
     return signal_df, peaks_dict
 
-def calculate_heartrate(peak_df: pd.DataFrame, parameters: Dict) -> float:
+def calculate_heartrate(peak_df: Union[pd.DataFrame, Dict[str, np.ndarray]], parameters: Union[Dict, params.EcgConfig]) -> float:
     """
     Calculate the average heart rate in beats per minute (BPM) based on detected R-peaks.
     
     Args:
-        signal_df (pd.DataFrame): DataFrame containing R-peak information with a column named 'ECG_R_Peaks'.
-            This DataFrame should be the output of the `find_peaks` function (i.e., signal_df).
-        parameters (Dict): A dictionary containing relevant parameters for the calculation.
+        signal_df (Union[pd.DataFrame, Dict[str, np.ndarray]]): DataFrame containing R-peak information with a column named 'ECG_R_Peaks'.
+            This DataFrame should be the output of the `find_peaks` function (i.e., signal_df). A dictionary mapping 
+            'ECG_R_Peaks' to a NumPy array of the R-peak markers (e.g., a window yielded by `iterate_batches`) is accepted as well.
+        parameters (Union[Dict, EcgConfig]): A dictionary containing relevant parameters for the calculation.
             - 'sampling_frequency' (int): The sampling frequency of the ECG signal in Hz. Defaults to 500 Hz.
     
     Returns:
@@ -96,17 +121,40 @@ def calculate_heartrate(peak_df: pd.DataFrame, parameters: Dict) -> float:
     Example:
         >>> heart_rate = calculate_heartrate(peaks_df, parameters)
     """
-    assert isinstance(peak_df, pd.DataFrame), "The 'peaks_df' argument must be a pandas DataFrame."
-    assert 'ECG_R_Peaks' in peak_df.columns, "The 'peaks_df' DataFrame must contain a column named 'ECG_R_Peaks'."
+    assert isinstance(peak_df, (pd.DataFrame, dict)), "The 'peaks_df' argument must be a pandas DataFrame or a dictionary of arrays."
+    assert 'ECG_R_Peaks' in peak_df, "The 'peaks_df' DataFrame must contain a column named 'ECG_R_Peaks'."
+
+    r_peaks = np.asarray(peak_df['ECG_R_Peaks'])
+    return _calculate_heartrate_fast(
+        np.count_nonzero(r_peaks), 
+        len(r_peaks), 
+        params.as_ecg_config(parameters).sampling_frequency
+    )
 
-    sampling_frequency = parameters['general'].get('sampling_frequency', 500)
-    signal_length_seconds = len(peak_df) / sampling_frequency
-    peak_count = peak_df['ECG_R_Peaks'].sum()
-    
-    # Calculate the average heart rate in beats per minute (BPM)
-    return (60 / signal_length_seconds) * peak_count
+def peaks_to_rr(r_peaks: np.ndarray, sampling_frequency: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extracts the R-peak sample indices and the RR intervals (in milliseconds) from an R-peak marker array in a single pass.
+    Uses a numba kernel if numba is installed, and NumPy otherwise.
+
+    Args:
+        r_peaks (np.ndarray): R-peak markers (non-zero where a peak was detected), e.g., the 'ECG_R_Peaks' column of `find_peaks`.
+        sampling_frequency (float): The sampling frequency of the ECG signal in Hz.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]:
+            - np.ndarray: The sample indices of the R-peaks (relative to the start of `r_peaks`).
+            - np.ndarray: The RR intervals in milliseconds (one less than the number of R-peaks).
 
-def calculate_signal_quality(ecg_cleaned_series: pd.Series, rpeaks: Optional[Union[Tuple, List]], parameters: Dict) -> Union[np.array, str]:
+    Example:
+        >>> peak_indices, rr_intervals_ms = peaks_to_rr(signals_df['ECG_R_Peaks'].to_numpy(), 500)
+    """
+    r_peaks = np.ascontiguousarray(r_peaks)
+    if njit is not None:
+        return _peaks_to_rr_kernel(r_peaks, float(sampling_frequency))
+    peak_indices = np.flatnonzero(r_peaks)
+    return peak_indices, np.diff(peak_indices) * (1000.0 / sampling_frequency)
+
+def calculate_signal_quality(ecg_cleaned_series: pd.Series, rpeaks: Optional[Union[Tuple, List, np.ndarray, Dict]], parameters: Union[Dict, params.EcgConfig]) -> Union[np.array, str]:
     """
     Calculates the quality of the ECG signal using NeuroKit2's `ecg_quality` function based on the provided parameters.
 
@@ -119,8 +167,10 @@ def calculate_signal_quality(ecg_cleaned_series: pd.Series, rpeaks: Optional[Uni
 
     Args:
         ecg_cleaned_series (pd.Series): The cleaned ECG signal as a pandas Series.
-        rpeaks (Optional[Union[Tuple, List]]): The list or tuple of R-peak samples as returned by `ecg_peaks()`. If None, R-peaks will be computed from the signal.
-        parameters (Dict): A dictionary of settings for the ECG quality calculation. Expected keys:
+        rpeaks (Optional[Union[Tuple, List, np.ndarray, Dict]]): The R-peak samples, or the info dictionary returned by `find_peaks` 
+            (its 'ECG_R_Peaks' entry is used). Pass the already detected R-peaks whenever possible: if None, NeuroKit2 detects 
+            the R-peaks again (with its default method) before calculating the quality.
+        parameters (Union[Dict, EcgConfig]): A dictionary of settings for the ECG quality calculation. Expected keys:
             - 'sampling_frequency' (int): The sampling frequency of the signal in Hz (samples per second). Defaults to 500 Hz.
             - 'signal_quality_index' (dict): Contains the signal quality index calculation parameters.
                 - 'method' (str): The method to use for signal quality calculation. Can be "averageQRS" (default) or "zhao2018".
@@ -131,17 +181,21 @@ def calculate_signal_quality(ecg_cleaned_series: pd.Series, rpeaks: Optional[Uni
             - If the "averageQRS" method is used, returns a vector of quality indices ranging from 0 to 1.
             - If the "zhao2018" method is used, returns a string classification of the signal quality: "Unacceptable", "Barely acceptable", or "Excellent".
     """
+    if isinstance(rpeaks, dict):
+        rpeaks = rpeaks['ECG_R_Peaks']
+    
+    ecg_config = params.as_ecg_config(parameters)
     signal_quality_array = nk.ecg_quality(
         ecg_cleaned=ecg_cleaned_series,
         rpeaks=rpeaks,
-        sampling_rate=parameters['general'].get('sampling_frequency', 500),
-        method=parameters['signal_quality_index'].get('method', 'averageQRS'),
-        approach=parameters['signal_quality_index'].get('approach', 'simple')
+        sampling_rate=ecg_config.sampling_frequency,
+        method=ecg_config.signal_quality_method,
+        approach=ecg_config.signal_quality_approach
     )
     
     return signal_quality_array
 
-def calculate_hrv_indices(peak_df: pd.DataFrame, parameters: Dict) -> pd.DataFrame:
+def calculate_hrv_indices(peak_df: Union[pd.DataFrame, Dict[str, np.ndarray]], parameters: Union[Dict, params.EcgConfig]) -> pd.DataFrame:
     """
     Calculates heart rate variability (HRV) indices from R-peak data using NeuroKit2's `hrv` functions.
 
@@ -152,11 +206,16 @@ def calculate_hrv_indices(peak_df: pd.DataFrame, parameters: Dict) -> pd.DataFra
     Args:
         peak_df (pd.DataFrame): A DataFrame containing R-peak information, such as indices of peaks or
             results from functions like `ecg_peaks()` or `ppg_peaks()`. It may also include R-R intervals
-            (RRI) and timestamps (RRI_Time).
-        parameters (Dict): A dictionary specifying calculation settings. Expected keys include:
+            (RRI) and timestamps (RRI_Time). A dictionary of NumPy arrays with the same keys (e.g., {'ECG_R_Peaks': peak_indices}) 
+            is accepted as well and avoids the DataFrame overhead. As in NeuroKit2, 'ECG_R_Peaks' holds R-peak markers 
+            (1 where a peak was detected) in a DataFrame and R-peak sample indices in a dictionary.
+        parameters (Union[Dict, EcgConfig]): A dictionary specifying calculation settings. Expected keys include:
             - 'sampling_frequency' (int): Sampling frequency of the signal in Hz. Defaults to 500 Hz.
             - 'compute_hrv_frequency_metrics' (bool): Flag indicating whether to compute frequency-domain metrics.
               Defaults to False.
+            - 'fast_time_domain' (bool): Flag indicating whether to only compute the standard time-domain metrics 
+              (HRV_MeanNN, HRV_SDNN, HRV_RMSSD, HRV_pNN50, HRV_pNN20) with NumPy instead of the full set of `nk.hrv_time`.
+              Defaults to False.
             - 'hrv_frequency_settings' (Dict): Settings for frequency-domain calculations if enabled, including:
                 - 'ulf' (List[float]): Range for ultra-low-frequency (ULF) in Hz, e.g., [0, 0.0033].
                 - 'vlf' (List[float]): Range for very-low-frequency (VLF) in Hz, e.g., [0.0033, 0.04].
@@ -188,35 +247,16 @@ def calculate_hrv_indices(peak_df: pd.DataFrame, parameters: Dict) -> pd.DataFra
         - Frasch (2022). "Advanced HRV analysis in signal processing."
 
     """
-    hrv_time = nk.hrv_time(
-        peak_df,
-        sampling_rate=parameters['general'].get('sampling_frequency', 500),
-        show=False
-    )
-    
-    if parameters['general'].get("compute_hrv_frequency_metrics", False):
-        hrv_frequency = nk.hrv_frequency(
-            peak_df,
-            sampling_rate=parameters['general'].get('sampling_frequency', 500),
-            ulf=parameters['hrv_frequency_settings'].get('ulf', [0, 0.0033]),
-            vlf=parameters['hrv_frequency_settings'].get('vlf', [0.0033, 0.04]),
-            lf=parameters['hrv_frequency_settings'].get('lf', [0.04, 0.15]),
-            hf=parameters['hrv_frequency_settings'].get('hf', [0.15, 0.4]),
-            vhf=parameters['hrv_frequency_settings'].get('vhf', [0.4, 0.5]),
-            psd_method=parameters['hrv_frequency_settings'].get('psd_method', 'welch'),
-            normalize=parameters['hrv_frequency_settings'].get('normalize', True),
-            show=False
-        )
-        return pd.concat([hrv_time, hrv_frequency], axis=1)
-    
-    return hrv_time
+    return pd.DataFrame([_calculate_hrv_indices_fast(peak_df, params.as_ecg_config(parameters))])
 
 def calculate_windowed_HRV_metrics(
     signals_df: pd.DataFrame, 
-    parameters: Dict, 
+    parameters: Union[Dict, params.EcgConfig], 
     export_segment_plot: bool = False, 
     figure_output_dir: Union[Path, str] = Path().cwd()/"segment_figures",
-    segment_name: str = ""
+    segment_name: str = "",
+    plot_executor: Optional[Executor] = None,
+    n_jobs: int = 1
 ) -> pd.DataFrame:
     """
     Calculates Heart Rate Variability (HRV) metrics over specified analysis windows (e.g., non-overlapping windods of 30s), optionally plotting and saving ECG segments.
@@ -227,12 +267,20 @@ def calculate_windowed_HRV_metrics(
             - 'ECG_Clean': The cleaned ECG signal.
             - 'ECG_Quality': The quality of the ECG signal.
             - 'ECG_R_Peaks': R-peak annotations (1 where peaks are detected, 0 otherwise).
-        parameters (Dict): A dictionary containing the analysis parameters, including:
+        parameters (Union[Dict, EcgConfig]): A dictionary containing the analysis parameters, including:
             - 'general': A dictionary with general parameters like:
                 - 'analysis_window_seconds': Duration of the analysis window in seconds.
                 - 'sampling_frequency': Sampling frequency of the ECG signal.
         export_segment_plot (bool, optional): If True, will save a plot of each ECG segment. Default is False.
         figure_output_dir (Union[Path, str], optional): Directory where segment plots will be saved if `export_segment_plot` is True. Default is 'segment_figures' in the current working directory.
+        plot_executor (Optional[Executor], optional): Executor (e.g., a `ThreadPoolExecutor`) to which the segment plots are 
+            submitted, so that they are rendered and saved in the background and the HRV calculation of the next window does 
+            not wait for the PNG export. The caller is responsible for shutting the executor down (e.g., to share it across 
+            segments). Default is None (a `ThreadPoolExecutor` with two threads is created for this call and all plots are 
+            saved before the function returns).
+        n_jobs (int, optional): Number of worker processes used to calculate the HRV metrics of the analysis windows in 
+            parallel (joblib semantics, -1 uses all cores). Plots are always created in the calling process. 
+            Default is 1 (sequential, no worker processes are started).
 
     Raises:
         ValueError: If the required columns are missing from the input DataFrame.
@@ -243,62 +291,94 @@ def calculate_windowed_HRV_metrics(
             - 'stop_index': Stop index of the analysis window.
             - 'analysis_window': Window count (integer).
             - 'heart_rate_bpm': Calculated heart rate in beats per minute.
-            - Other calculated HRV metrics depending on the implementation of `calculate_hrv_indices`.
+            - 'n_peaks_detected': Number of R-peaks in the analysis window.
+            - Other calculated HRV metrics depending on the implementation of `calculate_hrv_indices` (NaN for windows 
+              with less than `MIN_PEAKS_FOR_HRV` R-peaks).
 
     """
     # Check if expected columns are present
     expected_columns = ['ECG_Raw', 'ECG_Clean', 'ECG_R_Peaks']
-    for col in expected_columns:
-        if col not in signals_df.columns:
-            raise ValueError(f"Column '{col}' is missing from the DataFrame.")
+    missing_columns = set(expected_columns).difference(signals_df.columns)
+    if missing_columns:
+        raise ValueError(f"Columns {sorted(missing_columns)} are missing from the DataFrame.")
         
-    # Setup window size
-    window_size = int(parameters['general']['analysis_window_seconds'] * parameters['general']['sampling_frequency'])
-    hrv_indices_df = pd.DataFrame()
+    # Resolve the parameters once for all windows and setup window size
+    ecg_config = params.as_ecg_config(parameters)
+    window_size = int(ecg_config.analysis_window_seconds * ecg_config.sampling_frequency)
+    hrv_records = []
     
-    # Calculate metrics per analysis window
-    for window_count, peaks_analysis_window_df in enumerate(iterate_batches(signals_df, window_size)):
-        # Define window start and end based on the df's index, which should be in relative time (i.e., starting from 0)
-        sample_start_index = peaks_analysis_window_df.index.min()
-        sample_stop_index = peaks_analysis_window_df.index.max()
-        
-        # Calculate metrics
-        try:
-            heart_rate = calculate_heartrate(peaks_analysis_window_df, parameters)
-            hrv_indices_tmp_df = calculate_hrv_indices(peaks_analysis_window_df, parameters)
-            hrv_indices_tmp_df = (
-                hrv_indices_tmp_df
-                .assign(
-                    start_time=sample_start_index, 
-                    end_time=sample_stop_index, 
-                    analysis_window=window_count,
-                    heart_rate_bpm=heart_rate,
-                    n_peaks_detected=peaks_analysis_window_df['ECG_R_Peaks'].sum()
-                )
-            )
+    # The metrics only need the R-peaks, so the peak indices and RR intervals are extracted once for the whole signal
+    # and the peaks of each window are located with a binary search
+    n_samples = len(signals_df)
+    all_peak_indices, all_rr_intervals_ms = peaks_to_rr(signals_df['ECG_R_Peaks'].to_numpy(), ecg_config.sampling_frequency)
+    window_starts = np.arange(0, n_samples, window_size)
+    window_stops = np.minimum(window_starts + window_size, n_samples)
+    first_peaks = np.searchsorted(all_peak_indices, window_starts)
+    stop_peaks = np.searchsorted(all_peak_indices, window_stops)
+    
+    # Define windows start and end based on the df's index, which should be in relative time (i.e., starting from 0).
+    # The index is sorted, so these are the first and last index values of each window
+    signal_index = signals_df.index
+    windows = []
+    for window_count, (window_start, window_stop, first_peak, stop_peak) in enumerate(zip(window_starts, window_stops, first_peaks, stop_peaks)):
+        peak_indices = all_peak_indices[first_peak:stop_peak] - window_start  # relative to the window start
+        rr_intervals_ms = all_rr_intervals_ms[first_peak:max(stop_peak - 1, first_peak)]  # between the peaks of the window
+        windows.append((window_count, peak_indices, rr_intervals_ms, window_stop - window_start, 
+                        signal_index[window_start], signal_index[window_stop - 1]))
+    
+    # Prepare the plot export once for all windows
+    if export_segment_plot:
+        figure_output_dir = Path(figure_output_dir)
+        figure_output_dir.mkdir(parents=False, exist_ok=True)
+        figure_file_prefix = segment_name.replace("/", "_")
+    
+    # Calculate metrics per analysis window (lazily), either sequentially or distributed across worker processes
+    if n_jobs == 1:
+        window_results = (_process_window(*window, ecg_config) for window in windows)
+    else:
+        window_results = Parallel(n_jobs=n_jobs, backend='loky', return_as='generator')(
+            delayed(_process_window)(*window, ecg_config) for window in windows
+        )
+    
+    # Plots are saved by background threads while the next windows are processed. If the caller does not provide 
+    # an executor, a dedicated one is used and all plots are saved before returning
+    owns_plot_executor = export_segment_plot and plot_executor is None
+    with ThreadPoolExecutor(max_workers=2) if owns_plot_executor else nullcontext(plot_executor) as plot_executor:
+        for (window_count, *_), hrv_record in zip(windows, window_results):
+            # collect the metrics, the DataFrame is created once after the loop
+            if hrv_record is not None:
+                hrv_records.append(hrv_record)
             
-            # concatenate the metrics
-            hrv_indices_df = pd.concat([hrv_indices_df, hrv_indices_tmp_df])
-        except Exception as e:
-            print(f"Error calculating HRV metrics for window {window_count}: {e}")
-        
-        # Visualize the segment if required
-        if export_segment_plot:
-            segment_name = segment_name.replace("/", "_")
-            output_file = str(figure_output_dir / f"{segment_name}_{window_count}.png")
-            Path(figure_output_dir).mkdir(parents=False, exist_ok=True)
-            plot_utils.plot_ecg_segment(peaks_analysis_window_df, 
-                             output_file,
-                             figure_title=segment_name)
-    # Return HRV metrics DataFrame
-    return hrv_indices_df
+            # Visualize the segment if required
+            if export_segment_plot:
+                peaks_analysis_window_df = signals_df.iloc[window_count * window_size:(window_count + 1) * window_size]
+                output_file = str(figure_output_dir / f"{figure_file_prefix}_{window_count}.png")
+                plot_future = plot_executor.submit(_plot_window, 
+                                                   peaks_analysis_window_df, 
+                                                   output_file, 
+                                                   figure_title=figure_file_prefix)
+                plot_future.add_done_callback(_report_plot_error)
+    
+    # Return HRV metrics DataFrame (the window info columns are moved to the end, as windows without HRV metrics 
+    # would otherwise determine the column order if they come first)
+    if not hrv_records:
+        return pd.DataFrame()
+    hrv_indices_df = pd.DataFrame.from_records(hrv_records)
+    hrv_columns = [col for col in hrv_indices_df.columns if col not in _WINDOW_INFO_COLUMNS]
+    return hrv_indices_df[hrv_columns + _WINDOW_INFO_COLUMNS]
 
 
 
 
-def calculate_rsa_per_segment(segments_df_list: List[pd.DataFrame], parameters: Dict, subject_id: Union[str, int], data_output_dir: Union[Path, str]) -> pd.DataFrame:
+def calculate_rsa_per_segment(
+    segments_df_list: List[pd.DataFrame], 
+    parameters: Union[Dict, params.EcgConfig], 
+    subject_id: Union[str, int], 
+    data_output_dir: Union[Path, str],
+    export_excel: Optional[bool] = None
+) -> pd.DataFrame:
     """
-    Calculate RSA metrics for each segment in a list of ECG data segments and export the metrics as Excel sheet.
+    Calculate RSA metrics for each segment in a list of ECG data segments and export the metrics as Feather file.
 
     This function iterates over a list of segmented ECG DataFrames, calculates RSA metrics
     for each segment, and appends metadata (e.g., segment name, start time, end time) 
@@ -309,11 +389,14 @@ def calculate_rsa_per_segment(segments_df_list: List[pd.DataFrame], parameters:
             a segment of ECG data. Each segment must:
             - Contain at least one row of data.
             - Include a column `event_name` with a single unique value identifying the segment.
-        parameters (Dict): A dictionary containing configuration parameters. Must include:
+            Segments may contain a precomputed `heart_rate` column (see `calculate_RSA_metrics`).
+        parameters (Union[Dict, EcgConfig]): A dictionary containing configuration parameters. Must include:
             - 'general': A dictionary with the key 'sampling_frequency', which specifies the 
               sampling frequency of the ECG signal (default is typically 500 Hz).
         subject_id (Union[str, int]): Unique identifier for the subject to which the segments belong.
-        data_output_dir (Union[Path, str]): Directory to save the output RSA metrics
+        data_output_dir (Union[Path, str]): Directory to save the output RSA metrics (`rsa_metrics.feather`).
+        export_excel (Optional[bool], optional): If True, the RSA metrics are additionally saved as `rsa_metrics.xlsx`. 
+            Defaults to None, in which case the 'excel' setting of `parameters['io']` is used (False if not given).
 
     Returns:
         pd.DataFrame: A DataFrame containing RSA metrics for all segments. Each row corresponds to a
@@ -359,7 +442,8 @@ def calculate_rsa_per_segment(segments_df_list: List[pd.DataFrame], parameters:
         raise ValueError("Each segment in 'segments_df_list' must have a single event name.")
     
     
-    rsa_df = pd.DataFrame()
+    ecg_config = params.as_ecg_config(parameters)
+    rsa_df_list = []
     for segment_df in segments_df_list:
         # prep
         segment_name = segment_df.event_name.dropna().unique()[0]
@@ -367,7 +451,7 @@ def calculate_rsa_per_segment(segments_df_list: List[pd.DataFrame], parameters:
         segment_stop_time = segment_df.index.max()
         # calculate
         try:
-            rsa_segment_df = calculate_RSA_metrics(segment_df, parameters)
+            rsa_segment_df = calculate_RSA_metrics(segment_df, ecg_config)
         except Exception as e:
             print(f"Error calculating RSA metrics for segment '{segment_name}': {e}")
             continue
@@ -377,12 +461,18 @@ def calculate_rsa_per_segment(segments_df_list: List[pd.DataFrame], parameters:
             start_time=segment_start_time,
             end_time=segment_stop_time
             )
-        # add to the rsa_df
-        rsa_df = pd.concat([rsa_df, rsa_segment_df])
-        rsa_df = rsa_df.assign(subject_id = subject_id)
+        # collect the metrics, they are concatenated once after the loop
+        rsa_df_list.append(rsa_segment_df)
+    
+    rsa_df = pd.concat(rsa_df_list, ignore_index=True) if rsa_df_list else pd.DataFrame()
+    rsa_df = rsa_df.assign(subject_id = subject_id)
         
-    # save the RSA metrics
-    rsa_df.to_excel(Path(data_output_dir)/"rsa_metrics.xlsx")
+    # save the RSA metrics (feather is the default format, excel is only written on request)
+    rsa_df.to_feather(Path(data_output_dir)/"rsa_metrics.feather")
+    if export_excel is None:
+        export_excel = ecg_config.export_excel
+    if export_excel:
+        rsa_df.to_excel(Path(data_output_dir)/"rsa_metrics.xlsx")
         
     return rsa_df
         
@@ -390,7 +480,7 @@ def calculate_rsa_per_segment(segments_df_list: List[pd.DataFrame], parameters:
 
 
 
-def calculate_RSA_metrics(signals_df: pd.DataFrame, parameters: Dict) -> pd.DataFrame:
+def calculate_RSA_metrics(signals_df: pd.DataFrame, parameters: Union[Dict, params.EcgConfig]) -> pd.DataFrame:
     """
     Calculate Respiratory Sinus Arrhythmia (RSA) metrics from ECG signals.
 
@@ -402,7 +492,9 @@ def calculate_RSA_metrics(signals_df: pd.DataFrame, parameters: Dict) -> pd.Data
             - 'ECG_Raw': The raw ECG signal.
             - 'ECG_Clean': The preprocessed ECG signal.
             - 'ECG_R_Peaks': The locations of R-peaks in the ECG signal.
-        parameters (Dict): A dictionary containing configuration parameters. Must include:
+            If it contains a 'heart_rate' column (continuous heart rate as returned by `nk.ecg_rate`), it is used 
+            instead of recomputing the heart rate.
+        parameters (Union[Dict, EcgConfig]): A dictionary containing configuration parameters. Must include:
             - 'general': A dictionary with the key 'sampling_frequency', which specifies the 
               sampling frequency of the ECG signal (default is typically 500 Hz).
 
@@ -429,14 +521,18 @@ def calculate_RSA_metrics(signals_df: pd.DataFrame, parameters: Dict) -> pd.Data
 
     """
     expected_columns = ['ECG_Raw', 'ECG_Clean', 'ECG_R_Peaks']
-    for col in expected_columns:
-        if col not in signals_df.columns:
-            raise ValueError(f"Column '{col}' is missing from the DataFrame.")
+    missing_columns = set(expected_columns).difference(signals_df.columns)
+    if missing_columns:
+        raise ValueError(f"Columns {sorted(missing_columns)} are missing from the DataFrame.")
     
-    # Add continuous heart rate to the signals_df
-    sampling_frequency = parameters['general'].get('sampling_frequency', 500)
-    heart_rate = nk.ecg_rate(signals_df, sampling_rate=sampling_frequency, desired_length=len(signals_df))
-    signals_df = signals_df.assign(heart_rate=heart_rate)   
+    # Add continuous heart rate to the signals_df (unless it has already been computed, e.g., for the whole recording).
+    # It is passed to NeuroKit2 as 'ECG_Rate' as well, otherwise `nk.hrv_rsa` derives it from the R-peaks again
+    sampling_frequency = params.as_ecg_config(parameters).sampling_frequency
+    if 'heart_rate' in signals_df.columns:
+        heart_rate = signals_df['heart_rate'].to_numpy()
+    else:
+        heart_rate = nk.ecg_rate(signals_df, sampling_rate=sampling_frequency, desired_length=len(signals_df))
+    signals_df = signals_df.assign(heart_rate=heart_rate, ECG_Rate=heart_rate)
     
     # Calculate RSA metrics
     rsa_dict = nk.hrv_rsa(signals_df, sampling_rate=sampling_frequency)
@@ -468,8 +564,8 @@ def calculate_RSA_metrics(signals_df: pd.DataFrame, parameters: Dict) -> pd.Data
 #     for window_count, peaks_analysis_window_df in enumerate(iterate_batches(signals_df, window_size)):
         
 #         # Define window start and end based on the df's index, which should be in relative time (i.e., starting from 0)
-#         sample_start_index = peaks_analysis_window_df.index.min()
-#         sample_stop_index = peaks_analysis_window_df.index.max()
+#         sample_start_index = peaks_analysis_window_df.index[0]
+#         sample_stop_index = peaks_analysis_window_df.index[-1]
 #         print(f"Calculating RSA metrics for window {window_count} from {sample_start_index} to {sample_stop_index}")
 #         window_df = signals_df.loc[sample_start_index: sample_stop_index].copy()
 #         print(f"Length of the analysis window: {len(window_df)}")
@@ -494,7 +590,12 @@ def calculate_RSA_metrics(signals_df: pd.DataFrame, parameters: Dict) -> pd.Data
 
 
 
-def ecg_preprocess(raw_ecg_series: pd.Series, parameters: Dict) -> pd.DataFrame:
+def ecg_preprocess(
+    raw_ecg_series: pd.Series, 
+    parameters: Union[Dict, params.EcgConfig], 
+    use_cache: bool = False, 
+    cache_dir: Union[Path, str] = Path().cwd()/"ecg_preprocess_cache"
+) -> pd.DataFrame:
     """
     Preprocesses a raw ECG signal by cleaning it, detecting R-peaks, calculating signal quality, and returning a DataFrame containing
     the processed ECG data.
@@ -505,17 +606,21 @@ def ecg_preprocess(raw_ecg_series: pd.Series, parameters: Dict) -> pd.DataFrame:
 
     Args:
         raw_ecg_series (pd.Series): A pandas Series containing the raw ECG signal.
-        parameters (Dict): A dictionary of parameters for the various preprocessing functions, including:
+        parameters (Union[Dict, EcgConfig]): A dictionary of parameters for the various preprocessing functions, including:
             - 'sampling_frequency' (int): The sampling frequency of the ECG data in Hz.
             - 'cleaning' (dict): Parameters for the `clean_ecg` function, such as cleaning method and powerline frequency.
             - 'peak_detection' (dict): Parameters for the `find_peaks` function, including peak detection method and artifact correction.
             - 'signal_quality_index' (dict): Parameters for the `calculate_signal_quality` function, such as the quality calculation method.
+        use_cache (bool, optional): If True, the cleaned signal and the detected R-peaks are stored as parquet file in `cache_dir`
+            and reused when the function is called again with the same raw signal and the same cleaning and peak detection 
+            parameters (e.g., when re-running a notebook). Default is False.
+        cache_dir (Union[Path, str], optional): Directory of the cache files. Default is 'ecg_preprocess_cache' in the current working directory.
 
     Returns:
         pd.DataFrame: A DataFrame containing the following columns:
-            - 'ECG_Raw': The original raw ECG signal.
-            - 'ECG_Clean': The cleaned ECG signal.
-            - 'ECG_R_Peaks': Detected R-peaks in the signal (marked with 1).
+            - 'ECG_Raw': The original raw ECG signal (float32).
+            - 'ECG_Clean': The cleaned ECG signal (float32).
+            - 'ECG_R_Peaks': Detected R-peaks in the signal (marked with 1, uint8).
             - 'ECG_Quality': The calculated signal quality.
 
     Example:
@@ -531,21 +636,36 @@ def ecg_preprocess(raw_ecg_series: pd.Series, parameters: Dict) -> pd.DataFrame:
     Raises:
         ValueError: If the input ECG series is not of type `pd.Series`.
     """
-    raw_ecg_series.name = 'ECG_Raw'
-    time_index = raw_ecg_series.index # if a dedicated time index is given, it probably arrives via the raw data. Since it will be lost in the other calculations, we store it here and re-assign it later
-    raw_ecg_series = raw_ecg_series.reset_index(drop=True)
+    # if a dedicated time index is given, it probably arrives via the raw data. It is used as index of the returned DataFrame
+    time_index = raw_ecg_series.index
+    ecg_config = params.as_ecg_config(parameters)
     
-    ecg_cleaned_series = clean_ecg(raw_ecg_series, parameters)
-    peak_df, rpeaks = find_peaks(ecg_cleaned_series, parameters)
+    if use_cache:
+        cache_file = Path(cache_dir) / f"{_preprocess_cache_key(raw_ecg_series, ecg_config)}.parquet"
+        if cache_file.exists():
+            signals_df = pd.read_parquet(cache_file, engine="pyarrow")
+            signals_df.index = time_index
+            return signals_df
     
-    # Create a composite dataframe containing the entire signal and peak information
-    signals_df = pd.concat([
-            ecg_cleaned_series.to_frame(),
-            raw_ecg_series.to_frame(),
-            peak_df
-        ], axis=1)
+    ecg_cleaned_series = clean_ecg(raw_ecg_series, ecg_config)
+    peak_df, rpeaks = find_peaks(ecg_cleaned_series, ecg_config)
+    
+    # Create a composite dataframe containing the entire signal and peak information (all arrays have the same length).
+    # float32 is more than enough for the ECG signals and the R-peak markers are only 0/1, which reduces the memory footprint
+    signals_df = pd.DataFrame(
+        {
+            'ECG_Clean': ecg_cleaned_series.to_numpy(dtype=np.float32),
+            'ECG_Raw': raw_ecg_series.to_numpy(dtype=np.float32),
+            'ECG_R_Peaks': peak_df['ECG_R_Peaks'].to_numpy(dtype=np.uint8),
+        },
+        index=time_index,
+        copy=False
+    )
     # signals_df = signals_df.assign(ECG_Quality=signal_quality)
-    signals_df.index = time_index
+    
+    if use_cache:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        signals_df.to_parquet(cache_file, engine="pyarrow", compression="zstd", index=False)
     
     return signals_df
 
@@ -555,15 +675,175 @@ def ecg_preprocess(raw_ecg_series: pd.Series, parameters: Dict) -> pd.DataFrame:
 ##############
 
 
-def iterate_batches(df: pd.DataFrame, batch_size: int):
-    """Iterates over a DataFrame in batches of a specific size.
+def _calculate_heartrate_fast(n_peaks: int, n_samples: int, sampling_frequency: float) -> float:
+    """Implementation of `calculate_heartrate` on the (already counted) number of R-peaks and samples of a signal."""
+    # Calculate the average heart rate in beats per minute (BPM), i.e., peaks per signal length in minutes
+    return (60.0 * sampling_frequency / n_samples) * n_peaks
+
+
+def _calculate_hrv_indices_fast(
+    peak_df: Union[pd.DataFrame, Dict[str, np.ndarray]], 
+    ecg_config: params.EcgConfig, 
+    rr_intervals_ms: Optional[np.ndarray] = None
+) -> Dict[str, float]:
+    """
+    Implementation of `calculate_hrv_indices` with already resolved parameters, returning 
+    the HRV indices as dictionary. `peak_df` can be a DataFrame with R-peak markers or a dictionary with R-peak 
+    indices, e.g., {'ECG_R_Peaks': peak_indices} (see `calculate_hrv_indices`). If the RR intervals are already 
+    known, they can be passed as `rr_intervals_ms` and are then used by the fast time-domain path.
+    """
+    if ecg_config.fast_time_domain:
+        if rr_intervals_ms is None:
+            rr_intervals_ms = _rr_intervals_ms(peak_df, ecg_config.sampling_frequency)
+        hrv_indices = _hrv_time_fast(rr_intervals_ms)
+    else:
+        hrv_indices = nk.hrv_time(
+            peak_df,
+            sampling_rate=ecg_config.sampling_frequency,
+            show=False
+        ).to_dict('records')[0]
+    
+    if ecg_config.compute_hrv_frequency_metrics:
+        hrv_frequency = nk.hrv_frequency(
+            peak_df,
+            sampling_rate=ecg_config.sampling_frequency,
+            **ecg_config.hrv_frequency_kwargs,
+            show=False
+        )
+        hrv_indices.update(hrv_frequency.to_dict('records')[0])
+    
+    return hrv_indices
+
+
+def _rr_intervals_ms(peak_df: Union[pd.DataFrame, Dict[str, np.ndarray]], sampling_frequency: float) -> np.ndarray:
+    """
+    Returns the RR intervals (in milliseconds) of the R-peaks in `peak_df`, which are interpreted like NeuroKit2's 
+    `hrv_time` does: the 'ECG_R_Peaks' column of a DataFrame holds R-peak markers, the 'ECG_R_Peaks' entry of a 
+    dictionary holds R-peak sample indices.
+    """
+    if isinstance(peak_df, pd.DataFrame):
+        _, rr_intervals_ms = peaks_to_rr(peak_df['ECG_R_Peaks'].to_numpy(), sampling_frequency)
+        return rr_intervals_ms
+    return np.diff(np.asarray(peak_df['ECG_R_Peaks'])) * (1000.0 / sampling_frequency)
+
+
+def _hrv_time_fast(rr_intervals_ms: np.ndarray) -> Dict[str, float]:
+    """
+    Computes the standard time-domain HRV metrics from RR intervals (in milliseconds) with NumPy. 
+    The definitions follow `nk.hrv_time` (e.g., pNNx is relative to the number of RR intervals), so that the 
+    values are identical to the corresponding NeuroKit2 columns.
+    """
+    successive_differences = np.diff(rr_intervals_ms)
+    n_intervals = len(rr_intervals_ms)
+    return {
+        'HRV_MeanNN': np.mean(rr_intervals_ms),
+        'HRV_SDNN': np.std(rr_intervals_ms, ddof=1),
+        'HRV_RMSSD': np.sqrt(np.mean(successive_differences**2)),
+        'HRV_pNN50': np.count_nonzero(np.abs(successive_differences) > 50) / n_intervals * 100,
+        'HRV_pNN20': np.count_nonzero(np.abs(successive_differences) > 20) / n_intervals * 100,
+    }
+
+
+def _process_window(
+    window_count: int, 
+    peak_indices: np.ndarray, 
+    rr_intervals_ms: np.ndarray, 
+    n_samples: int, 
+    sample_start_index: float, 
+    sample_stop_index: float, 
+    ecg_config: params.EcgConfig
+) -> Optional[Dict[str, float]]:
+    """
+    Calculates the heart rate and HRV metrics of a single analysis window of `n_samples` samples from its R-peak indices 
+    (relative to the window start) and RR intervals. Used as unit of work by `calculate_windowed_HRV_metrics`, so it must 
+    remain picklable (i.e., a module-level function).
+
+    Returns:
+        Optional[Dict[str, float]]: The metrics of the window (one record of the output DataFrame), or None if the 
+            calculation failed. Windows with less than `MIN_PEAKS_FOR_HRV` R-peaks only contain the window info (no HRV metrics).
+    """
+    try:
+        heart_rate = _calculate_heartrate_fast(len(peak_indices), n_samples, ecg_config.sampling_frequency)
+        if len(peak_indices) < MIN_PEAKS_FOR_HRV:
+            # Not enough peaks for meaningful HRV metrics (they are NaN in the DataFrame of all windows)
+            hrv_record = {}
+        else:
+            hrv_record = _calculate_hrv_indices_fast({'ECG_R_Peaks': peak_indices}, ecg_config, rr_intervals_ms)
+        hrv_record.update(
+            start_time=sample_start_index, 
+            end_time=sample_stop_index, 
+            analysis_window=window_count,
+            heart_rate_bpm=heart_rate,
+            n_peaks_detected=len(peak_indices)
+        )
+        return hrv_record
+    except Exception as e:
+        print(f"Error calculating HRV metrics for window {window_count}: {e}")
+        return None
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _peaks_to_rr_kernel(r_peaks: np.ndarray, sampling_frequency: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Numba kernel of `peaks_to_rr`, collects the peak indices into a preallocated buffer and derives the RR intervals."""
+        peak_indices = np.empty(r_peaks.shape[0], dtype=np.int64)
+        n_peaks = 0
+        for sample in range(r_peaks.shape[0]):
+            if r_peaks[sample] != 0:
+                peak_indices[n_peaks] = sample
+                n_peaks += 1
+        samples_to_ms = 1000.0 / sampling_frequency
+        rr_intervals_ms = np.empty(max(n_peaks - 1, 0), dtype=np.float64)
+        for peak in range(1, n_peaks):
+            rr_intervals_ms[peak - 1] = (peak_indices[peak] - peak_indices[peak - 1]) * samples_to_ms
+        return peak_indices[:n_peaks], rr_intervals_ms
+
+
+def _preprocess_cache_key(raw_ecg_series: pd.Series, ecg_config: params.EcgConfig) -> str:
+    """
+    Creates the cache key of `ecg_preprocess` from the raw signal and the parameters used for cleaning and peak detection.
+    The NeuroKit2 version is part of the key, so that the cache is invalidated when NeuroKit2 is updated.
+    """
+    relevant_parameters = {
+        'sampling_frequency': ecg_config.sampling_frequency,
+        'cleaning_method': ecg_config.cleaning_method,
+        'powerline': ecg_config.powerline,
+        'peak_method': ecg_config.peak_method,
+        'correct_artifacts': ecg_config.correct_artifacts,
+        'neurokit_version': nk.__version__,
+    }
+    cache_key = hashlib.blake2b(digest_size=20)
+    cache_key.update(np.ascontiguousarray(raw_ecg_series.to_numpy()).tobytes())
+    cache_key.update(json.dumps(relevant_parameters, sort_keys=True, default=str).encode())
+    return cache_key.hexdigest()
+
+
+def _plot_window(window_df: pd.DataFrame, output_file: str, figure_title: str) -> None:
+    """Saves the plot of an analysis window, reusing the figure of the (background) thread instead of creating one per window."""
+    plot_utils.plot_ecg_segment(window_df, output_file, figure_title=figure_title, fig=plot_utils.get_thread_figure())
+
+
+def _report_plot_error(future: Future) -> None:
+    """Prints the error of a failed background plot export, which would otherwise go unnoticed."""
+    if future.exception() is not None:
+        print(f"Error exporting segment plot: {future.exception()}")
+
+
+def iterate_batches(df: Union[pd.DataFrame, Dict[str, np.ndarray]], batch_size: int):
+    """Iterates over a DataFrame (or a dictionary of equally long NumPy arrays) in batches of a specific size.
 
     Args:
-        df (pd.DataFrame): The DataFrame to iterate over.
+        df (Union[pd.DataFrame, Dict[str, np.ndarray]]): The DataFrame or dictionary of arrays to iterate over.
         batch_size (int): The number of rows per batch.
 
     Yields:
-        pd.DataFrame: A DataFrame representing the current batch.
+        Union[pd.DataFrame, Dict[str, np.ndarray]]: A DataFrame representing the current batch (or a dictionary of 
+            array views, if `df` is a dictionary).
     """
-    for start in range(0, len(df), batch_size):
-        yield df.iloc[start:start + batch_size]
+    if isinstance(df, pd.DataFrame):
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start + batch_size]
+    else:
+        n_rows = len(next(iter(df.values()))) if df else 0
+        for start in range(0, n_rows, batch_size):
+            yield {key: values[start:start + batch_size] for key, values in df.items()}
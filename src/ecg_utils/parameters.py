@@ -3,36 +3,78 @@ Default Parameters and functions related to changing parameters
 """
 
 
-from typing import Dict, List
-from copy import deepcopy
+import copy
+from typing import Any, Dict, List, Optional, Tuple, Union
+from functools import lru_cache
+from dataclasses import dataclass
+
+
+class FrozenDict(dict):
+    """
+    Read-only dictionary used for `base_params`, so that the shared default parameters cannot be changed by accident 
+    (e.g., by a function that modifies its parameters in place). Modifications raise a TypeError. 
+    
+    FrozenDicts behave like regular dictionaries otherwise: they can be pickled (e.g., to send them to worker processes) 
+    and exported with `common.export_to_yaml`. `copy.deepcopy` returns a regular, mutable (nested) dictionary, which is 
+    the way to customize the parameters:
+    
+        >>> my_params = copy.deepcopy(base_params)
+        >>> my_params['cleaning']['powerline'] = 60
+    """
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("The parameters are read-only, modify a copy instead (e.g., from `copy.deepcopy`).")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __deepcopy__(self, memo: Dict) -> Dict:
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+
+def _freeze(parameters: Any) -> Any:
+    """Converts the (nested) dictionaries of a parameter dictionary into `FrozenDict`s (existing `FrozenDict`s are kept)."""
+    if isinstance(parameters, FrozenDict):
+        return parameters
+    if isinstance(parameters, dict):
+        return FrozenDict({key: _freeze(value) for key, value in parameters.items()})
+    return parameters
 
 # Default parameters
 # Visit Neurokit website for parameters: https://neuropsychology.github.io/NeuroKit/_modules/neurokit2/signal/signal_filter.html#signal_filter
 # 
 
-base_params = {
+base_params = _freeze({
     'general': {
         'sampling_frequency': 500,
         'analysis_window_seconds': 30, # calculate HRV metrics in non-overlapping windows.
-        'compute_hrv_frequency_metrics': False # might not work if analysis window is short
+        'compute_hrv_frequency_metrics': False, # might not work if analysis window is short
+        'fast_time_domain': False # only compute MeanNN, SDNN, RMSSD, pNN50 and pNN20 (much faster than the full NeuroKit time-domain set)
     },
     'cleaning': {
         'method': 'neurokit',
         'powerline': 50  # or 60
     },
     'peak_detection': {
-        'method': 'neurokit',
+        'method': 'neurokit', # or e.g. 'vg' (visibility graph detector, Emrich et al. 2023, requires the ts2vg package): linear time and robust to noise, suited for long recordings
         'correct_artifacts': True
     },
-    'hrv_frequency_settings': {
-        'ulf': [0, 0.0033], # The spectral power of ultra low frequencies
-        'vlf': [0.0033, 0.04], # The spectral power of very low frequencies
-        'lf': [0.04, 0.15], # The spectral power of low frequencies
-        'hf': [0.15, 0.4],
-        'vhf': [0.4, 0.5], # The spectral power of very high frequencies
+    'hrv_frequency_settings': { # frequency bands as (lower, upper) tuples
+        'ulf': (0, 0.0033), # The spectral power of ultra low frequencies
+        'vlf': (0.0033, 0.04), # The spectral power of very low frequencies
+        'lf': (0.04, 0.15), # The spectral power of low frequencies
+        'hf': (0.15, 0.4),
+        'vhf': (0.4, 0.5), # The spectral power of very high frequencies
         'psd_method': 'welch',
         'normalize': True
     },
+    'io': {
+        'excel': False # additionally export the HRV metrics as excel file (parquet files are always written)
+    },
     'segmentation': {
         'Baseline': { # name of the segment (does not have to correspond to the name in the event.txt)
             'event_name':'Baseline', # put here the event name from the *event.txt file (e.g., baseline resting start)
@@ -54,33 +96,43 @@ base_params = {
             'event_name':'Story 5',
             },
     }
-}
+})
 
 
 ########################################################################################
 
 
 # Only configure here the parameters to be updated for a given subject if they
-# differ from the default parameters specfied above.
+# differ from the default parameters specfied above. Per subject ID and dyad member ('child' or 'mother'), 
+# the entries of each section that replace the defaults (see `configure_ecg_params`).
+# Like `base_params`, the overrides are read-only, as the customized parameters of `base_params` are cached per subject.
+SUBJECT_OVERRIDES: Dict[Union[int, str], Dict[str, Dict[str, Dict]]] = _freeze({
+    # 8: {'child': {'cleaning': {'powerline': 40}}},
+    # 4: {'mother': {'general': {'compute_hrv_frequency_metrics': True}}},
+    
+    # Add more subject IDs as needed
+})
+
+
 def configure_ecg_params(subject_id: int, pipeline_params: Dict) -> List[Dict]:
     """
     Configures and customizes pipeline parameters for ECG processing based on the subject ID.
 
     This function allows customization of ECG processing parameters for both the child and mother 
     in a subject dyad, based on the unique subject ID. If no customizations are needed, the function 
-    returns the default parameters. Subject-specific customizations can be applied by modifying the 
-    `pipeline_params` dictionary for each subject.
+    returns the default parameters. Subject-specific customizations are configured in `SUBJECT_OVERRIDES` 
+    and applied to the `pipeline_params` dictionary for each subject.
 
     Example:
         If the subject has a specific powerline frequency (e.g., 40 instead of the default 50), 
-        you can update the 'cleaning' section for the child:
+        you can update the 'cleaning' section for the child with the entry `8: {'child': {'cleaning': {'powerline': 40}}}` in `SUBJECT_OVERRIDES`:
 
         child_params, mother_params = configure_ecg_params(subject_id=8, pipeline_params=base_params)
         # This will return child_params with updated cleaning parameters:
         # child_params['cleaning']['powerline'] = 40
         
         If another subject requires a different heart rate variability (HRV) calculation, you can modify 
-        the 'general' settings for the mother:
+        the 'general' settings for the mother with the entry `4: {'mother': {'general': {'compute_hrv_frequency_metrics': True}}}` in `SUBJECT_OVERRIDES`:
 
         child_params, mother_params = configure_ecg_params(subject_id=4, pipeline_params=base_params)
         # This will return mother_params with custom HRV settings, for example:
@@ -94,23 +146,49 @@ def configure_ecg_params(subject_id: int, pipeline_params: Dict) -> List[Dict]:
 
     Returns:
         List[Dict]: A list of two dictionaries, `child_params` and `mother_params`, where both contain 
-                    the customized pipeline parameters based on the subject ID.
+                    the customized pipeline parameters based on the subject ID. Nothing is copied: without customizations, 
+                    `pipeline_params` itself is returned, and customized parameters share all sections without overrides 
+                    with `pipeline_params`. The results must therefore not be modified in place (copy them with 
+                    `copy.deepcopy` first). For `base_params`, the customization is computed once per subject ID and then reused 
+                    (as read-only `FrozenDict`s).
     """
-    child_params = deepcopy(pipeline_params)
-    mother_params = deepcopy(pipeline_params)
-    
-    # Customize parameters based on subject_id
-    # if subject_id == 8:
-    #     child_params['cleaning'].update({"powerline": 40})
+    if pipeline_params is base_params:
+        return _configure_base_ecg_params(subject_id)
+    return _configure_ecg_params(subject_id, pipeline_params)
+
+
+@lru_cache(maxsize=None)
+def _configure_base_ecg_params(subject_id: int) -> Tuple[Dict, Dict]:
+    """
+    Cached customization of `base_params`. The cached results are handed out as they are, so they are frozen 
+    (sections without overrides are shared with `base_params`). As `base_params` and `SUBJECT_OVERRIDES` are read-only, 
+    the cache cannot become stale.
+    """
+    child_params, mother_params = _configure_ecg_params(subject_id, base_params)
+    return _freeze(child_params), _freeze(mother_params)
 
-    # elif subject_id == "4":
-    #     mother_params['general'].update({"key2": "value2"})
-    
-    # Add more conditions for other subject IDs as needed
 
+def _configure_ecg_params(subject_id: int, pipeline_params: Dict) -> Tuple[Dict, Dict]:
+    """Applies the subject-specific customizations of `SUBJECT_OVERRIDES` (see `configure_ecg_params`)."""
+    subject_overrides = SUBJECT_OVERRIDES.get(subject_id, {})
+    child_params = _apply_overrides(pipeline_params, subject_overrides.get('child'))
+    mother_params = _apply_overrides(pipeline_params, subject_overrides.get('mother'))
     return child_params, mother_params
 
 
+def _apply_overrides(pipeline_params: Dict, overrides: Optional[Dict[str, Dict]]) -> Dict:
+    """
+    Returns `pipeline_params` with the entries of each overridden section replaced, merged in a single pass. 
+    Sections without overrides are shared with `pipeline_params`, which is returned as is if there are no overrides.
+    """
+    if not overrides:
+        return pipeline_params
+    return {
+        **pipeline_params, 
+        **{section: {**pipeline_params[section], **entries} for section, entries in overrides.items()}
+    }
+
+
 
 def configure_segmentation_params(subject_id: int, pipeline_params: Dict) -> Dict:
     """
@@ -142,9 +220,10 @@ def configure_segmentation_params(subject_id: int, pipeline_params: Dict) -> Dic
 
     Returns:
         Dict: The customized segmentation parameters based on the subject ID. 
-              If no customizations are made, the default segmentation settings are returned.
+              If no customizations are made, the default segmentation settings are returned. Only the 'segmentation' 
+              section is copied (and may be modified), all other sections are shared with `pipeline_params`.
     """
-    parameters = deepcopy(pipeline_params)
+    parameters = {**pipeline_params, 'segmentation': _clone_params(pipeline_params['segmentation'])}
     
     # Customize parameters based on subject_id
     # if subject_id == 8:
@@ -153,3 +232,108 @@ def configure_segmentation_params(subject_id: int, pipeline_params: Dict) -> Dic
     # Add more conditions for other subject IDs as needed
 
     return parameters
+
+
+def _clone_params(parameters: Dict) -> Dict:
+    """
+    Copies a parameter dictionary, i.e., its (nested) dictionaries and lists. The values are immutable (numbers, strings), 
+    so they are shared, which is much cheaper than `copy.deepcopy`.
+    """
+    if isinstance(parameters, dict):
+        return {key: _clone_params(value) for key, value in parameters.items()}
+    if isinstance(parameters, list):
+        return [_clone_params(value) for value in parameters]
+    return parameters
+
+
+
+########################################################################################
+
+
+@dataclass(frozen=True, slots=True)
+class EcgConfig:
+    """
+    Immutable, resolved version of the ECG pipeline parameters (see `base_params`). 
+
+    The functions of `nk_pipeline` accept either a parameter dictionary or an `EcgConfig`. Resolving the parameters 
+    once into an `EcgConfig` replaces the nested dictionary lookups (including defaults) of every function call by 
+    attribute access, and gives IDEs and type checkers the available settings. The defaults of the fields correspond 
+    to the defaults used by the pipeline functions for missing dictionary entries.
+
+    Example:
+        >>> ecg_config = EcgConfig.from_dict(base_params)
+        >>> signals_df = nk_pipeline.ecg_preprocess(raw_ecg_series, ecg_config)
+    """
+    # general
+    sampling_frequency: int = 500
+    analysis_window_seconds: float = 30
+    compute_hrv_frequency_metrics: bool = False
+    fast_time_domain: bool = False
+    # cleaning
+    cleaning_method: str = 'neurokit'
+    powerline: float = 50
+    # peak detection
+    peak_method: str = 'neurokit'
+    correct_artifacts: bool = False
+    # signal quality index
+    signal_quality_method: str = 'averageQRS'
+    signal_quality_approach: str = 'simple'
+    # hrv frequency settings
+    ulf: Tuple[float, float] = (0, 0.0033)
+    vlf: Tuple[float, float] = (0.0033, 0.04)
+    lf: Tuple[float, float] = (0.04, 0.15)
+    hf: Tuple[float, float] = (0.15, 0.4)
+    vhf: Tuple[float, float] = (0.4, 0.5)
+    psd_method: str = 'welch'
+    normalize: bool = True
+    # io
+    export_excel: bool = False
+
+    @classmethod
+    def from_dict(cls, parameters: Dict) -> "EcgConfig":
+        """
+        Creates an `EcgConfig` from a parameter dictionary structured like `base_params`. Missing sections or 
+        entries fall back to the defaults of the fields, other sections (e.g., 'segmentation') are ignored.
+        """
+        general = parameters.get('general', {})
+        cleaning = parameters.get('cleaning', {})
+        peak_detection = parameters.get('peak_detection', {})
+        signal_quality_index = parameters.get('signal_quality_index', {})
+        hrv_frequency_settings = parameters.get('hrv_frequency_settings', {})
+        defaults = cls()
+        return cls(
+            sampling_frequency=general.get('sampling_frequency', defaults.sampling_frequency),
+            analysis_window_seconds=general.get('analysis_window_seconds', defaults.analysis_window_seconds),
+            compute_hrv_frequency_metrics=general.get('compute_hrv_frequency_metrics', defaults.compute_hrv_frequency_metrics),
+            fast_time_domain=general.get('fast_time_domain', defaults.fast_time_domain),
+            cleaning_method=cleaning.get('method', defaults.cleaning_method),
+            powerline=cleaning.get('powerline', defaults.powerline),
+            peak_method=peak_detection.get('method', defaults.peak_method),
+            correct_artifacts=peak_detection.get('correct_artifacts', defaults.correct_artifacts),
+            signal_quality_method=signal_quality_index.get('method', defaults.signal_quality_method),
+            signal_quality_approach=signal_quality_index.get('approach', defaults.signal_quality_approach),
+            ulf=tuple(hrv_frequency_settings.get('ulf', defaults.ulf)),
+            vlf=tuple(hrv_frequency_settings.get('vlf', defaults.vlf)),
+            lf=tuple(hrv_frequency_settings.get('lf', defaults.lf)),
+            hf=tuple(hrv_frequency_settings.get('hf', defaults.hf)),
+            vhf=tuple(hrv_frequency_settings.get('vhf', defaults.vhf)),
+            psd_method=hrv_frequency_settings.get('psd_method', defaults.psd_method),
+            normalize=hrv_frequency_settings.get('normalize', defaults.normalize),
+            export_excel=parameters.get('io', {}).get('excel', defaults.export_excel),
+        )
+
+    @property
+    def hrv_frequency_kwargs(self) -> Dict:
+        """The frequency band settings as keyword arguments of `nk.hrv_frequency`."""
+        return dict(ulf=self.ulf, vlf=self.vlf, lf=self.lf, hf=self.hf, vhf=self.vhf, 
+                    psd_method=self.psd_method, normalize=self.normalize)
+
+
+def as_ecg_config(parameters: Union[Dict, EcgConfig]) -> EcgConfig:
+    """
+    Returns the given parameters as `EcgConfig`. Parameter dictionaries are converted with `EcgConfig.from_dict`, 
+    an `EcgConfig` is returned as is.
+    """
+    if isinstance(parameters, EcgConfig):
+        return parameters
+    return EcgConfig.from_dict(parameters)
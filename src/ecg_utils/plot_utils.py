@@ -10,61 +10,152 @@ https://neuropsychology.github.io/NeuroKit/functions/ecg.html
 """
 
 # fmt: off
-from typing import Dict, Tuple, Union, List, Optional, Any
-import pandas as pd
-import matplotlib.pyplot as plt
+from __future__ import annotations
+from typing import Dict, Tuple, Union, List, Optional, Any, TYPE_CHECKING
+import threading
+import numpy as np
 from pathlib import Path
+if TYPE_CHECKING:  # matplotlib (and pandas) are only imported when a plot is created, see `_create_ecg_figure`
+    import pandas as pd
+    from matplotlib.figure import Figure
 # fmt: on
 
+# Figures reused by `get_thread_figure`, one per thread (matplotlib figures must not be drawn by two threads at once)
+_thread_figures = threading.local()
+
+# Signals longer than this are downsampled before plotting (about twice the pixel width of the saved figure)
+_MAX_PLOT_POINTS = 4000
+
+# Title of the segment plots, filled with the figure title and the start and stop time
+_SUPTITLE_TEMPLATE = '{}: ECG Segment from {} to {} seconds'
+
 
 
 ############################
 #### PLOTTING FUNCTIONS ####
 ############################
 
-def plot_ecg_segment(df: pd.DataFrame, output_file: Union[Path, str], figure_title:str="") -> plt.Figure:
+def plot_ecg_segment(df: pd.DataFrame, output_file: Union[Path, str], figure_title:str="", fig: Optional[Figure]=None) -> Figure:
     """
     Plots an ECG segment showing the raw and the preprocessed ECG signal with marked R-peaks, and saves the plot as a PNG file.
+    The figure is created without pyplot (i.e., it is not registered in pyplot's global figure manager), which makes 
+    this function safe to call from background threads.
 
     Args:
         df (pd.DataFrame): A DataFrame containing the ECG data. It must include the following columns:
             - 'ECG_Raw': The raw ECG signal.
             - 'ECG_Clean': The cleaned ECG signal.
             - 'ECG_R_Peaks': R-peak annotations (1 where peaks are detected, 0 otherwise).
+            The index (time in seconds) must be sorted in increasing order.
         output_file (Union[Path, str]): The file path where the plot image will be saved.
+        figure_title (str, optional): Prefix of the figure title. Defaults to "".
+        fig (Optional[Figure], optional): Existing figure to draw on (e.g., from `get_thread_figure`). The axes of a figure 
+            with the 2x1 layout of this plot are cleared and reused, other figures are cleared completely. Reusing one 
+            figure for many plots avoids creating and tearing down a figure per plot. Defaults to None (a new figure is created).
 
     Raises:
         ValueError: If the required columns are missing from the input DataFrame.
 
     Returns:
-        plt.Figure: The matplotlib figure object for the created plot.
+        Figure: The matplotlib figure object for the created plot.
     """
     expected_columns = ['ECG_Raw', 'ECG_Clean', 'ECG_R_Peaks']
-    for col in expected_columns:
-        if col not in df.columns:
-            raise ValueError(f"Column '{col}' is missing from the DataFrame.")
+    missing_columns = set(expected_columns).difference(df.columns)
+    if missing_columns:
+        raise ValueError(f"Columns {sorted(missing_columns)} are missing from the DataFrame.")
         
-    sample_start_index = df.index.min()
-    sample_stop_index = df.index.max()
-    fig, axes = plt.subplots(2, 1, figsize=(13, 6), constrained_layout=True)
+    # the signals are passed to matplotlib as NumPy arrays (views of the DataFrame's data), which skips the 
+    # conversion of pandas objects in every plot call
+    time = df.index.to_numpy(copy=False)
+    ecg_raw = df['ECG_Raw'].to_numpy(copy=False)
+    ecg_clean = df['ECG_Clean'].to_numpy(copy=False)
+    is_peak = df['ECG_R_Peaks'].to_numpy(copy=False) == 1
     
-    plt.suptitle(f'{figure_title}: ECG Segment from {sample_start_index} to {sample_stop_index} seconds', fontsize=16, x = 0.2)
+    # the segment is ordered by time, so the first and last index are its start and stop
+    sample_start_index = time[0]
+    sample_stop_index = time[-1]
+    if fig is None:
+        fig = _create_ecg_figure()
+    elif len(fig.axes) == 2:
+        for ax in fig.axes:
+            ax.cla()
+    else:
+        fig.clear()
+        fig.subplots(2, 1)
+    axes = fig.axes
     
-    axes[0].set_title(f'Raw ECG')
-    axes[0].plot(df['ECG_Raw'], color = 'k')
+    fig.suptitle(_SUPTITLE_TEMPLATE.format(figure_title, sample_start_index, sample_stop_index), fontsize=16, x = 0.01, horizontalalignment='left')
+    
+    # long signals are reduced to the minimum and maximum per pixel-sized bucket, which looks the same once rasterized
+    raw_indices = _downsample_minmax_indices(ecg_raw, _MAX_PLOT_POINTS)
+    clean_indices = _downsample_minmax_indices(ecg_clean, _MAX_PLOT_POINTS, keep=is_peak)
+    
+    axes[0].set_title('Raw ECG')
+    axes[0].plot(time[raw_indices], ecg_raw[raw_indices], color = 'k', rasterized=True)
     axes[0].set_xlabel('Time in seconds')
     axes[0].set_ylabel('mV')
 
-    axes[1].set_title(f'Cleaned ECG')
-    axes[1].plot(df['ECG_Clean'], color = 'k')
+    axes[1].set_title('Cleaned ECG')
+    # R-peaks are drawn as markers of the cleaned ECG line itself (markevery), no separate scatter is needed
+    axes[1].plot(time[clean_indices], ecg_clean[clean_indices], color = 'k', marker='v', markevery=is_peak[clean_indices], 
+                 markersize=6, markerfacecolor='red', markeredgecolor='red', rasterized=True)
     axes[1].set_xlabel('Time in seconds')
     axes[1].set_ylabel('mV')
-    for index, row_series in df.iterrows():
-        if row_series['ECG_R_Peaks'] == 1:
-            axes[1].scatter(row_series.name, row_series['ECG_Clean'], color='red', marker='v', zorder=3)
    
-    # Save the plot
-    plt.savefig(output_file, dpi=135, bbox_inches='tight')
-    plt.close()
+    # Save the plot (constrained layout already fits all elements into the figure, no bbox_inches='tight' pass is needed)
+    fig.savefig(output_file, dpi=135)
 
     return fig
+
+
+def get_thread_figure() -> Figure:
+    """
+    Returns a figure for `plot_ecg_segment` that is reused by all calls from the current thread. 
+    As every thread gets its own figure, plots can be saved by several background threads at once.
+    """
+    if not hasattr(_thread_figures, "figure"):
+        _thread_figures.figure = _create_ecg_figure()
+    return _thread_figures.figure
+
+
+def _create_ecg_figure() -> Figure:
+    """
+    Creates the 2x1 figure of `plot_ecg_segment`, attached to an Agg canvas so that saving PNGs does not switch canvases. 
+    matplotlib is imported here (i.e., only when plots are created), as importing it takes a few hundred milliseconds. 
+    pyplot is not used, so no (GUI) backend needs to be selected.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    
+    fig = Figure(figsize=(13, 6), constrained_layout=True)
+    FigureCanvasAgg(fig)
+    fig.subplots(2, 1)
+    return fig
+
+
+def _downsample_minmax_indices(values: np.ndarray, n_out: int, keep: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Returns the (sorted) indices of `values` to plot, i.e., the positions of the minimum and maximum of `n_out / 2` 
+    equally sized buckets, plus the samples of an incomplete last bucket. All indices are returned if `values` has 
+    at most `n_out` elements.
+
+    Args:
+        values (np.ndarray): The signal to downsample.
+        n_out (int): The approximate number of samples to keep.
+        keep (Optional[np.ndarray], optional): Boolean mask of samples that are always kept (e.g., R-peaks). Defaults to None.
+
+    Returns:
+        np.ndarray: The indices of the samples to plot.
+    """
+    n_samples = len(values)
+    if n_samples <= n_out:
+        return np.arange(n_samples)
+    n_buckets = n_out // 2
+    bucket_size = n_samples // n_buckets
+    n_bucketed = n_buckets * bucket_size
+    buckets = values[:n_bucketed].reshape(n_buckets, bucket_size)
+    bucket_starts = np.arange(0, n_bucketed, bucket_size)
+    indices = [bucket_starts + buckets.argmin(axis=1), bucket_starts + buckets.argmax(axis=1), np.arange(n_bucketed, n_samples)]
+    if keep is not None:
+        indices.append(np.flatnonzero(keep))
+    return np.unique(np.concatenate(indices))